@@ -0,0 +1,106 @@
+"""
+answer_cache.py
+言い回し違いの同じ質問に、保存済みの回答を返す意味的キャッシュ
+（質問ベクトルのコサイン類似度 + mode + 参照チャンクID集合 で一致判定）
+"""
+import threading
+
+import numpy as np
+
+import config as cf
+
+
+class SemanticAnswerCache:
+    """
+    質問ベクトルを行列で保持し、NumPy の一括内積で類似質問を探す
+    - mode と参照チャンクID集合が同じエントリだけを比較対象にする
+    - 件数上限を超えたら最後に使われたのが最も古いものを置き換える（LRU）
+    - インデックスの世代番号が変わったら全件破棄
+    """
+
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize  # 件数上限
+        self.threshold = threshold  # 一致とみなすコサイン類似度
+        self._lock = threading.Lock()
+        self._version = None  # キャッシュ内容が対応するインデックス世代
+        self._vecs = None  # (maxsize, 次元) の正規化済み質問ベクトル（初回保存時に確保）
+        self._ctx = np.zeros(maxsize, dtype=np.int64)  # (mode, チャンクID集合) のハッシュ
+        self._used = np.zeros(maxsize, dtype=np.int64)  # 最終使用時刻（カウンタ）。0 は空き
+        self._entries = [None] * maxsize  # (mode, チャンクID集合, 回答)
+        self._tick = 0  # 使用カウンタ
+        self.hits = 0  # ヒット件数
+        self.misses = 0  # ミス件数
+
+    @staticmethod
+    def _context_key(mode, chunk_ids):
+        ctx = (mode or "all", frozenset(chunk_ids))
+        return ctx, hash(ctx)
+
+    @staticmethod
+    def _unit(vec):  # 単位ベクトル化
+        v = np.asarray(vec, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _check_version(self, version):  # 世代が変わっていたら破棄（ロック内で呼ぶ）
+        if version != self._version:
+            self._used[:] = 0
+            self._entries = [None] * self.maxsize
+            self._version = version
+
+    def lookup(self, vec, mode, chunk_ids, version):  # 類似質問の回答を返す（なければ None）
+        ctx, ctx_hash = self._context_key(mode, chunk_ids)
+        q = self._unit(vec)
+        with self._lock:
+            self._check_version(version)
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+            idx = np.flatnonzero((self._used > 0) & (self._ctx == ctx_hash))  # 同じ文脈のみ
+            if idx.size:
+                sims = self._vecs[idx] @ q  # 一括でコサイン類似度
+                best = int(np.argmax(sims))
+                slot = int(idx[best])
+                entry = self._entries[slot]
+                if sims[best] >= self.threshold and entry and entry[0] == ctx:
+                    self._tick += 1
+                    self._used[slot] = self._tick
+                    self.hits += 1
+                    return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, vec, mode, chunk_ids, answer, version):  # 保存
+        ctx, ctx_hash = self._context_key(mode, chunk_ids)
+        q = self._unit(vec)
+        with self._lock:
+            self._check_version(version)
+            if self._vecs is None or self._vecs.shape[1] != q.shape[0]:  # 初回 or 次元変更
+                self._vecs = np.zeros((self.maxsize, q.shape[0]), dtype=np.float32)
+                self._used[:] = 0
+                self._entries = [None] * self.maxsize
+            slot = int(np.argmin(self._used))  # 空き（0）か最も古いもの
+            self._vecs[slot] = q
+            self._ctx[slot] = ctx_hash
+            self._tick += 1
+            self._used[slot] = self._tick
+            self._entries[slot] = (ctx, answer)
+
+    def clear(self):  # 全削除（インデックス破棄時）
+        with self._lock:
+            self._used[:] = 0
+            self._entries = [None] * self.maxsize
+
+    def stats(self) -> dict:  # 集計値
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "entries": int((self._used > 0).sum()),
+            }
+
+
+ANSWER_CACHE = SemanticAnswerCache(  # プロセス共有インスタンス
+    maxsize=cf.ANSWER_CACHE_MAX_ENTRIES, threshold=cf.ANSWER_CACHE_SIMILARITY)
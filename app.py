@@ -1,9 +1,10 @@
 import streamlit as st
-from init import initialize_app
+from init import initialize_app, init_log_context, init_retrievers
 from ui_components import render_header, render_footer
 import config as cf
 import ui_components
 import helpers as hp
+import tracing
 
 st.set_page_config(
     page_title=cf.APP_TITLE,
@@ -30,7 +31,9 @@ if not st.session_state.get("initialized"):
         st.error(ui_components.compose_error_message(cf.ERROR_MSG_INIT_FAILED))
         st.stop()
 else:
+    init_log_context()  # この実行のログにセッションIDを付ける
     logger = st.session_state.get("logger")
+    init_retrievers()  # 共有インデックスが再構築されていれば参照を張り替える
 
 for k, v in {
     "flow_step": 0, "flow_mode": None,
@@ -54,14 +57,11 @@ with st.sidebar:
     with col_b:
         if st.button("履歴保存", use_container_width=True, key="btn_save_history"):
             st.session_state.user_id = uid.strip()
-            # autosave を確実に発火させる
-            hp.append_message("__noop__", "")
-            st.session_state.messages = [
-                m for m in st.session_state.messages if m["role"] != "__noop__"]
+            hp.save_history()  # 現在の履歴で保存ファイルを置き換え
             st.success("履歴を保存しました。")
     with col_c:
         if st.button("履歴クリア", use_container_width=True, key="btn_clear_history"):
-            st.session_state.messages = []
+            hp.clear_history()
             st.success("履歴をクリアしました。")
 
 render_header()
@@ -117,27 +117,26 @@ elif st.session_state.flow_step == 2:
             st.markdown(m["content"])
 
     if st.session_state.get("flow_is_generating"):
-        with st.spinner("回答を生成中..."):
-            try:
-                pending_q = st.session_state.get("flow_pending_q", "").strip()
-                if pending_q:
-                    if logger:
-                        logger.debug(
-                            f"[RAG] mode={st.session_state.flow_mode} pending_q={pending_q}")
-                    llm_response = ui_components.get_llm_response(
+        try:
+            pending_q = st.session_state.get("flow_pending_q", "").strip()
+            if pending_q:
+                if logger:
+                    logger.debug(
+                        "[RAG] mode=%s pending_q=%s", st.session_state.flow_mode, pending_q)
+                with tracing.trace(mode=st.session_state.flow_mode):  # 質問1件分の計測
+                    ai_content = ui_components.render_streaming_answer(
                         pending_q, mode=st.session_state.flow_mode
-                    )
-                    ai_content = llm_response.get("answer", "AI回答生成に失敗しました。")
+                    )  # トークンを逐次表示
                     hp.append_message("assistant", ai_content)
-            except Exception as e:
-                msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
-                (logger.error(msg) if logger else print(msg))
-                st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
-            finally:
-                st.session_state.flow_is_generating = False
-                st.session_state.flow_pending_q = ""
-                st.session_state._scroll_bottom = True
-                st.rerun()
+        except Exception as e:
+            msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
+            (logger.error(msg) if logger else print(msg))
+            st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
+        finally:
+            st.session_state.flow_is_generating = False
+            st.session_state.flow_pending_q = ""
+            st.session_state._scroll_bottom = True
+            st.rerun()
 
     with st.form("flow_query_form_12", clear_on_submit=True):
         q = st.text_input(f"{mode_label}について知りたいことを入力",
@@ -180,26 +179,25 @@ elif st.session_state.flow_step == 3:
 
     # 生成中（mode='research' を確実に渡す）
     if st.session_state.get("flow_is_generating"):
-        with st.spinner("回答を生成中..."):
-            try:
-                pending_q = st.session_state.get("flow_pending_q", "").strip()
-                if pending_q:
-                    if logger:
-                        logger.debug(
-                            f"[RAG] mode=research pending_q={pending_q}")
-                    llm_response = ui_components.get_llm_response(
-                        pending_q, mode="research")
-                    ai_content = llm_response.get("answer", "AI回答生成に失敗しました。")
+        try:
+            pending_q = st.session_state.get("flow_pending_q", "").strip()
+            if pending_q:
+                if logger:
+                    logger.debug(
+                        "[RAG] mode=research pending_q=%s", pending_q)
+                with tracing.trace(mode="research"):  # 質問1件分の計測
+                    ai_content = ui_components.render_streaming_answer(
+                        pending_q, mode="research")  # トークンを逐次表示
                     hp.append_message("assistant", ai_content)
-            except Exception as e:
-                msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
-                (logger.error(msg) if logger else print(msg))
-                st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
-            finally:
-                st.session_state.flow_is_generating = False
-                st.session_state.flow_pending_q = ""
-                st.session_state._scroll_bottom = True
-                st.rerun()
+        except Exception as e:
+            msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
+            (logger.error(msg) if logger else print(msg))
+            st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
+        finally:
+            st.session_state.flow_is_generating = False
+            st.session_state.flow_pending_q = ""
+            st.session_state._scroll_bottom = True
+            st.rerun()
 
     with st.form("flow_query_form_3", clear_on_submit=True):
         q = st.text_input("研究室について知りたいことを入力", key="flow_query_input_3")
@@ -238,26 +236,25 @@ elif st.session_state.flow_step == 4:
             st.markdown(m["content"])
 
     if st.session_state.get("flow_is_generating"):
-        with st.spinner("回答を生成中..."):
-            try:
-                pending_q = st.session_state.get("flow_pending_q", "").strip()
-                if pending_q:
-                    if logger:
-                        logger.debug(
-                            f"[RAG] mode=campus pending_q={pending_q}")
-                    llm_response = ui_components.get_llm_response(
-                        pending_q, mode="campus")
-                    ai_content = llm_response.get("answer", "AI回答生成に失敗しました。")
+        try:
+            pending_q = st.session_state.get("flow_pending_q", "").strip()
+            if pending_q:
+                if logger:
+                    logger.debug(
+                        "[RAG] mode=campus pending_q=%s", pending_q)
+                with tracing.trace(mode="campus"):  # 質問1件分の計測
+                    ai_content = ui_components.render_streaming_answer(
+                        pending_q, mode="campus")  # トークンを逐次表示
                     hp.append_message("assistant", ai_content)
-            except Exception as e:
-                msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
-                (logger.error(msg) if logger else print(msg))
-                st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
-            finally:
-                st.session_state.flow_is_generating = False
-                st.session_state.flow_pending_q = ""
-                st.session_state._scroll_bottom = True
-                st.rerun()
+        except Exception as e:
+            msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
+            (logger.error(msg) if logger else print(msg))
+            st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
+        finally:
+            st.session_state.flow_is_generating = False
+            st.session_state.flow_pending_q = ""
+            st.session_state._scroll_bottom = True
+            st.rerun()
 
     # 入力フォーム
     with st.form("flow_query_form_4", clear_on_submit=True):
@@ -306,20 +303,19 @@ if st.session_state.flow_step == 0:
         if last_user:
             with st.chat_message("user"):
                 st.markdown(last_user)
-        with st.spinner("回答を生成中..."):
-            try:
-                llm_response = ui_components.get_llm_response(
-                    last_user, mode=None)
-                ai_content = llm_response.get("answer", "AI回答生成に失敗しました。")
+        try:
+            with tracing.trace(mode="all"):  # 質問1件分の計測
+                ai_content = ui_components.render_streaming_answer(
+                    last_user, mode=None)  # トークンを逐次表示
                 hp.append_message("assistant", ai_content)
-                st.session_state.is_generating = False
-                st.rerun()
-            except Exception as e:
-                msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
-                (logger.error(msg) if logger else print(msg))
-                st.session_state.is_generating = False
-                st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
-                st.stop()
+            st.session_state.is_generating = False
+            st.rerun()
+        except Exception as e:
+            msg = f"{cf.ERROR_MSG_LLM_RESPONSE_FAILED}\n{e}"
+            (logger.error(msg) if logger else print(msg))
+            st.session_state.is_generating = False
+            st.error(cf.ERROR_MSG_LLM_RESPONSE_FAILED)
+            st.stop()
 
     chat_input = st.chat_input(cf.CHAT_INPUT_PLACEHOLDER)
     if chat_input and not st.session_state.is_generating:
@@ -0,0 +1,87 @@
+"""
+async_runner.py
+同期コード（Streamlit のスクリプト）から非同期処理を呼ぶためのプロセス共有イベントループ
+ループは専用スレッドで動かし続ける（LLM・埋め込みクライアントの非同期接続プールを使い回すため。
+呼び出しごとに asyncio.run すると、閉じたループの接続が残って再利用できない）
+呼び出し元の contextvars（ログのセッションID・トレース）を引き継いで実行する
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config as cf
+
+
+class LoopRunner:
+    """専用スレッドのイベントループでコルーチンを実行し、結果を同期的に受け取る"""
+
+    def __init__(self):
+        self._loop = None  # イベントループ（初回呼び出し時に起動）
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop.set_default_executor(ThreadPoolExecutor(  # asyncio.to_thread の実行先
+                    max_workers=cf.ASYNC_THREAD_WORKERS, thread_name_prefix="async-runner-io"))
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="async-runner", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro) -> concurrent.futures.Future:  # ループに投入（呼び出し元のコンテキストで実行）
+        loop = self._ensure_loop()
+        context = contextvars.copy_context()
+        future = concurrent.futures.Future()
+
+        def _start():
+            if not future.set_running_or_notify_cancel():  # 開始前に取り消された
+                coro.close()
+                return
+            task = loop.create_task(coro, context=context)
+            task.add_done_callback(lambda t: _copy_result(t, future))
+
+        loop.call_soon_threadsafe(_start)
+        return future
+
+    def run(self, coro, timeout: float | None = None):  # 完了まで待って結果を返す
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, agen):  # 非同期ジェネレータを同期ジェネレータとして回す
+        """要素は1つずつループ側で取り出す（途中で止めた場合もループ側で閉じる）"""
+        try:
+            while True:
+                try:
+                    item = self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            self.run(agen.aclose())
+
+    def close(self):  # ループを止める（終了時）
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+def _copy_result(task, future):  # Task の結果を concurrent.futures.Future に写す
+    if task.cancelled():
+        future.set_exception(concurrent.futures.CancelledError())
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(task.result())
+
+
+RUNNER = LoopRunner()  # プロセス共有インスタンス
+atexit.register(RUNNER.close)
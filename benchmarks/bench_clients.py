@@ -0,0 +1,97 @@
+"""
+bench_clients.py
+LLM クライアントを毎回生成する場合と、共有レジストリ（clients.py）を使う場合の
+1リクエストあたりのオーバーヘッド比較（ローカルの OpenAI 互換スタブサーバーに接続）
+
+使い方:
+    python benchmarks/bench_clients.py --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_CHAT_RESPONSE = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"},
+                 "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}).encode("utf-8")
+
+
+class _StubHandler(BaseHTTPRequestHandler):  # OpenAI 互換の最小スタブ
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    disable_nagle_algorithm = True  # ヘッダと本文の分割送信で遅延させない
+    connections = set()  # 受け付けた TCP 接続（クライアント側ポート）
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.lock:
+            self.connections.add(self.client_address)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(_CHAT_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(_CHAT_RESPONSE)
+
+    def log_message(self, *args):  # アクセスログは出さない
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def _run(label, make_llm, n):  # n 回呼び出して所要時間を集計
+    _StubHandler.connections = set()
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        make_llm().invoke("ping")
+        times.append(time.perf_counter() - t0)
+    times.sort()
+    print(f"{label:<24} mean={statistics.mean(times) * 1e3:7.2f}ms "
+          f"p50={times[len(times) // 2] * 1e3:7.2f}ms "
+          f"p95={times[int(len(times) * 0.95) - 1] * 1e3:7.2f}ms "
+          f"connections={len(_StubHandler.connections)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    server, base_url = _start_server()
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+    import config as cf
+    cf.OPENAI_BASE_URL = base_url  # 共有クライアントもスタブへ向ける
+    import clients
+    from langchain_openai import ChatOpenAI
+
+    def _per_request():  # 従来：リクエストごとに生成
+        return ChatOpenAI(model_name=cf.MODEL_NAME, temperature=cf.TEMPERATURE,
+                          openai_api_base=base_url)
+
+    _run("per-request client", _per_request, args.requests)
+    _run("shared registry client", clients.get_llm, args.requests)
+    print("(ローカル HTTP のため TLS ハンドシェイク分は含まない。実環境では差がさらに大きくなる)")
+    clients.reset()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
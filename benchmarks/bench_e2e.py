@@ -0,0 +1,218 @@
+"""
+bench_e2e.py
+API キーなしで動かすエンドツーエンドのベンチマーク（インデックス構築 → 検索 → 回答生成。Streamlit なし）
+埋め込みはハッシュ埋め込み、LLM は待ち時間を指定できるスタブ（fakes.py）
+data/ のコーパスを倍率分だけ複製して規模を変え（pdf / docx も複製）、以下を計測する
+    - pdf MB: 複製後の pdf / docx の合計（LOADER_PARALLEL_MIN_BYTES 以上なら解析は別プロセスで並列）
+    - cold start: 空の状態からの index_builder.get_shared_engine（解析・分割・埋め込み・索引構築）
+    - restart: 構築済みのベクトルDB・台帳がある状態での index_builder.get_shared_engine
+    - peak RSS: 本体プロセスの最大常駐メモリ（解析ワーカーは child 列）
+    - 質問ごとのレイテンシ（初回 = キャッシュなし / 2回目以降 = キャッシュあり）とスループット
+
+使い方:
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --scales 1,10 --llm-latency 0.5 --token-latency 0.02
+    python benchmarks/bench_e2e.py --scales 100 --async   # 非同期経路（aanswer）で計測
+    python benchmarks/bench_e2e.py --scales 100 --no-binary-replicas   # pdf / docx は1部のみ
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+QUESTIONS_PATH = os.path.join(BENCH_DIR, "retrieval_questions.json")
+_REPLICA_EXTS = (".txt", ".csv")  # 値に印を付けて複製するファイル
+_BINARY_EXTS = (".pdf", ".docx")  # 名前だけ変えて複製するファイル（解析の負荷を倍率に合わせる）
+_REPLICA_RE = re.compile(r"_r\d{4}\.[^./\\]+$")  # 複製ファイル名（例: campus_info_r0002.csv）
+
+
+def _tag_csv(src, dst, tag):  # 全セルに印を付けた CSV（ヘッダはそのまま）
+    with open(src, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    with open(dst, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerows(rows[:1] + [[f"{cell}{tag}" if cell else cell for cell in row]
+                                     for row in rows[1:]])
+
+
+def _tag_txt(src, dst, tag):  # 空行以外の各行末に印を付けたテキスト
+    with open(src, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    with open(dst, "w", encoding="utf-8") as f:
+        f.write("\n".join(f"{line}{tag}" if line.strip() else line for line in lines) + "\n")
+
+
+def build_corpus(src: str, dst: str, scale: int, binary: bool = True):  # data/ を scale 倍に複製
+    """
+    1部目は元のファイルをそのまま（全形式）、2部目以降は txt / csv を
+    値ごとに別の名前（例: 山田 太郎 R0002）へ書き換えて複製する
+    （同じ本文が並ぶと重複除去されて規模が増えないため）
+    binary=True なら pdf / docx も名前だけ変えて複製する（本文は同じ。解析の量と
+    LOADER_PARALLEL_MIN_BYTES の判定を倍率に合わせるため）
+    """
+    shutil.copytree(src, dst)
+    for dirpath, _, filenames in os.walk(src):
+        rel = os.path.relpath(dirpath, src)
+        for name in filenames:
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in _REPLICA_EXTS and not (binary and ext.lower() in _BINARY_EXTS):
+                continue
+            for r in range(2, scale + 1):
+                tag = f" R{r:04d}"
+                out = os.path.join(dst, rel, f"{stem}_r{r:04d}{ext}")
+                if ext.lower() in _BINARY_EXTS:  # 名前だけ変えた複製
+                    shutil.copyfile(os.path.join(dirpath, name), out)
+                    continue
+                (_tag_csv if ext.lower() == ".csv" else _tag_txt)(
+                    os.path.join(dirpath, name), out, tag)
+
+
+def _binary_mb(path: str) -> float:  # pdf / docx の合計サイズ（MB）
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames
+                     if os.path.splitext(name)[1].lower() in _BINARY_EXTS)
+    return total / (1 << 20)
+
+
+def is_replica(source: str) -> bool:  # build_corpus が作った複製ファイルか
+    return bool(_REPLICA_RE.search(source or ""))
+
+
+def _peak_rss_mb(who) -> float:  # 最大常駐メモリ（MB。Linux は KB、macOS は byte 単位）
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _pct(values, q):  # パーセンタイル（最近傍順位）
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+def run_child(args):  # 1つの規模・段階を計測して JSON を書き出す（別プロセスで実行）
+    t_import = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, BENCH_DIR)
+    import clients
+    import config as cf
+    from fakes import HashEmbeddings, StubChatModel
+
+    cf.RAG_ROOT_PATH = os.path.join(args.work, "data")  # すべて作業ディレクトリに置く
+    cf.VECTORSTORE_DIR = os.path.join(args.work, "vectorstore")
+    cf.MANIFEST_PATH = os.path.join(args.work, "vectorstore", "manifest.json")
+    cf.EMBED_CACHE_PATH = os.path.join(args.work, "cache", "embeddings.sqlite3")
+    cf.LOG_DIR = os.path.join(args.work, "logs")
+    cf.LOG_LEVEL = "WARNING"
+    clients.register("embeddings", HashEmbeddings())
+    clients.register("llm", StubChatModel(
+        latency=args.llm_latency, token_latency=args.token_latency))
+
+    import index_builder
+    from async_runner import RUNNER
+    from log_context import configure_logging
+    import_s = time.perf_counter() - t_import
+
+    configure_logging()
+    t0 = time.perf_counter()
+    engine = index_builder.get_shared_engine()  # インデックス構築
+    result = {
+        "phase": args.phase,
+        "import_s": import_s,
+        "init_s": time.perf_counter() - t0,
+        "chunks": len(engine.chunks_by_id),
+    }
+
+    if args.phase == "build":
+        with open(QUESTIONS_PATH, encoding="utf-8") as f:
+            questions = json.load(f)[:args.queries or None]
+        passes = []  # pass ごとの各質問のレイテンシ（秒）
+        for _ in range(args.repeat):
+            times = []
+            for q in questions:
+                t = time.perf_counter()
+                mode = None if q["mode"] == "all" else q["mode"]
+                if args.use_async:
+                    RUNNER.run(engine.aanswer(q["question"], mode))
+                else:
+                    engine.answer(q["question"], mode)
+                times.append(time.perf_counter() - t)
+            passes.append(times)
+        warm = [t for times in passes[1:] for t in times]
+        result.update({
+            "queries": len(questions),
+            "cold_p50_ms": _pct(passes[0], 0.5) * 1000,
+            "cold_p95_ms": _pct(passes[0], 0.95) * 1000,
+            "cold_qps": len(passes[0]) / sum(passes[0]) if passes[0] else 0.0,
+            "warm_p50_ms": _pct(warm, 0.5) * 1000,
+            "warm_qps": len(warm) / sum(warm) if warm else 0.0,
+        })
+    result["rss_mb"] = _peak_rss_mb(resource.RUSAGE_SELF)
+    result["child_rss_mb"] = _peak_rss_mb(resource.RUSAGE_CHILDREN)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def _spawn(args, work, phase):  # 計測用の子プロセス（peak RSS を規模ごとに分けるため）
+    out = os.path.join(work, f"{phase}.json")
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", "--phase", phase,
+           "--work", work, "--out", out, "--queries", str(args.queries),
+           "--repeat", str(args.repeat), "--llm-latency", str(args.llm_latency),
+           "--token-latency", str(args.token_latency)] + (["--async"] if args.use_async else [])
+    proc = subprocess.run(cmd, cwd=work, capture_output=True, text=True)  # bare mode の警告は出さない
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f"{phase} failed (exit {proc.returncode})")
+    with open(out, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", default="10,100,1000", help="コーパスの倍率（カンマ区切り）")
+    parser.add_argument("--queries", type=int, default=0, help="使う質問数（0 なら全件）")
+    parser.add_argument("--repeat", type=int, default=3, help="質問集を流す回数（2回目以降はキャッシュあり）")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="LLM の最初のトークンまでの秒数")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="LLM のトークン間の秒数")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="非同期経路（RagEngine.aanswer）で回答する")
+    parser.add_argument("--no-binary-replicas", dest="binary", action="store_false",
+                        help="pdf / docx は複製しない（元の1部のみ）")
+    parser.add_argument("--keep", action="store_true", help="作業ディレクトリを残す")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--phase", choices=("build", "restart"), help=argparse.SUPPRESS)
+    parser.add_argument("--work", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    print(f"{'scale':>6} {'pdf MB':>7} {'chunks':>7} {'cold s':>7} {'restart s':>9} {'rss MB':>7} {'child MB':>8} "
+          f"{'miss p50':>9} {'miss p95':>9} {'miss qps':>8} {'hit p50':>8} {'hit qps':>8}")
+    for scale in (int(s) for s in args.scales.split(",") if s.strip()):
+        work = tempfile.mkdtemp(prefix=f"bench_e2e_{scale}x_")
+        try:
+            build_corpus(os.path.join(ROOT, "data"), os.path.join(work, "data"), scale, args.binary)
+            binary_mb = _binary_mb(os.path.join(work, "data"))
+            cold = _spawn(args, work, "build")
+            restart = _spawn(args, work, "restart")
+        finally:
+            if not args.keep:
+                shutil.rmtree(work, ignore_errors=True)
+        print(f"{scale:>5}x {binary_mb:>7.1f} {cold['chunks']:>7} {cold['init_s']:>7.2f} {restart['init_s']:>9.2f} "
+              f"{cold['rss_mb']:>7.0f} {cold['child_rss_mb']:>8.0f} "
+              f"{cold['cold_p50_ms']:>7.1f}ms {cold['cold_p95_ms']:>7.1f}ms {cold['cold_qps']:>8.1f} "
+              f"{cold['warm_p50_ms']:>6.1f}ms {cold['warm_qps']:>8.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
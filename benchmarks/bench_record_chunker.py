@@ -0,0 +1,68 @@
+"""
+bench_record_chunker.py
+ラベル付きレコード分割のマイクロベンチマーク（従来の正規表現 findall と record_chunker の比較）
+
+使い方:
+    python benchmarks/bench_record_chunker.py --records 1000 10000 100000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import record_chunker as rc  # noqa: E402
+
+_TEMPLATE = (
+    "学科名: {name}学科\n"
+    "概要: {name}に関する基礎から応用までを学ぶ\n"
+    "カリキュラム: 基礎数学、{name}概論、{name}演習\n"
+    "講師の先生: 田中教授（{name}）、佐藤准教授（{name}応用）\n"
+    "雰囲気: 実験中心で活気ある\n"
+)
+
+
+def _legacy_split(text):  # 従来の分割（init_retrievers 内の実装をそのまま再現）
+    labels = [r"学部名[:：]", r"学科名[:：]", r"施設名[:：]",
+              r"イベント名[:：]", r"証明書名[:：]"]
+    split_pattern = r"((?:" + "|".join(labels) + \
+        r").+?)(?=\n(?:" + "|".join(labels) + r")|$)"
+    return re.findall(split_pattern, text, flags=re.DOTALL)
+
+
+def make_text(n_records):  # 合成データ生成
+    return "\n".join(_TEMPLATE.format(name=f"分野{i}") for i in range(n_records))
+
+
+def _best_of(fn, text, repeat):  # 最良値（秒）
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'chars':>12} {'legacy[ms]':>12} {'chunker[ms]':>12} {'speedup':>8}")
+    for n in args.records:
+        text = make_text(n)
+        legacy = [r.rstrip() for r in _legacy_split(text)]
+        current = rc.split_records(text)  # 上限なしで同じ結果になることを確認
+        if legacy != current:
+            raise SystemExit(f"mismatch at records={n}")
+        t_legacy = _best_of(_legacy_split, text, args.repeat)
+        t_new = _best_of(lambda s: rc.split_records(s, 500), text, args.repeat)
+        print(f"{n:>10} {len(text):>12} {t_legacy * 1e3:>12.1f} {t_new * 1e3:>12.1f} "
+              f"{t_legacy / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
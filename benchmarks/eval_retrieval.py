@@ -0,0 +1,143 @@
+"""
+eval_retrieval.py
+検索プロファイルごとの recall@n / MRR@n と検索レイテンシの評価（data/ コーパス + 固定の質問集）
+埋め込みは既定でオフラインのハッシュ埋め込み（--embeddings openai で実際の API）
+--scale で data/ を bench_e2e.build_corpus の方法で複製し、紛らわしい候補の多いコーパスで評価する
+（複製ファイルのチャンクは正解に数えない）
+
+使い方:
+    python benchmarks/eval_retrieval.py
+    python benchmarks/eval_retrieval.py --no-entity --repeat 5
+    python benchmarks/eval_retrieval.py --scale 10 --cutoffs 1,3,5
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import build_corpus, is_replica  # noqa: E402
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_questions.json")
+
+
+def _profile_sets(cf):  # 比較するプロファイル（名前 → RETRIEVAL_PROFILES 形式）
+    base = cf.RETRIEVAL_PROFILES
+    vector_only = {name: {**p, "retriever": "vector"} for name, p in base.items()}
+    return {
+        "legacy mmr fetch_k=k": {"default": {
+            "retriever": "vector", "search_type": "mmr", "k": cf.TOP_K,
+            "fetch_k": 15, "lambda_mult": 0.3, "score_threshold": None}},
+        "similarity": {"default": {**base["default"], "retriever": "vector",
+                                   "search_type": "similarity"}},
+        "config (vector)": vector_only,
+        "config": base,
+    }
+
+
+def _original(docs, k):  # 上位 k 件のうち元コーパスのチャンク（複製は正解に数えない）
+    return [d for d in docs[:k] if not is_replica(str((d.metadata or {}).get("source", "")))]
+
+
+def _recall(docs, expected, k):  # 上位 k 件に含まれる期待文字列の割合
+    text = "\n".join(d.page_content for d in _original(docs, k))
+    return sum(1 for e in expected if e in text) / len(expected)
+
+
+def _reciprocal_rank(docs, expected, k):  # 上位 k 件で最初に正解チャンクが現れた順位の逆数
+    for rank, doc in enumerate(docs[:k], start=1):
+        if _original([doc], 1) and any(e in doc.page_content for e in expected):
+            return 1.0 / rank
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--embeddings", choices=("hash", "openai"), default="hash")
+    parser.add_argument("--no-entity", action="store_true",
+                        help="エンティティ完全一致段を外し、ベクトル / ハイブリッド段を評価する")
+    parser.add_argument("--repeat", type=int, default=3, help="レイテンシ計測の繰り返し回数")
+    parser.add_argument("--cutoffs", default="3,5",
+                        help="recall@n の n（カンマ区切り）。MRR は最大の n まで見る")
+    parser.add_argument("--scale", type=int, default=1, help="data/ を何倍に複製して評価するか")
+    args = parser.parse_args()
+    cutoffs = sorted({int(n) for n in args.cutoffs.split(",") if n.strip()})
+
+    import clients
+    import config as cf
+    work = tempfile.mkdtemp(prefix="eval_retrieval_")  # インデックスは一時ディレクトリに作る
+    cf.RAG_ROOT_PATH = os.path.join(ROOT, "data")
+    if args.scale > 1:  # 複製コーパス
+        cf.RAG_ROOT_PATH = os.path.join(work, "data")
+        build_corpus(os.path.join(ROOT, "data"), cf.RAG_ROOT_PATH, args.scale,
+                     binary=False)  # 本文が同じ pdf / docx の複製は同点の重複になるだけなので入れない
+    cf.VECTORSTORE_DIR = os.path.join(work, "vectorstore")
+    cf.MANIFEST_PATH = os.path.join(work, "vectorstore", "manifest.json")
+    cf.EMBED_CACHE_PATH = os.path.join(work, "cache", "embeddings.sqlite3")
+    if args.embeddings == "hash":
+        from fakes import HashEmbeddings
+        clients.register("embeddings", HashEmbeddings())
+
+    import index_builder
+    import retrieval as rt
+    from bm25_index import BM25Index
+    from keyword_index import normalize_text
+    from rag_engine import _QueryVector
+    from tracing import _percentile
+
+    t0 = time.perf_counter()
+    index = index_builder.build_index(version=0)
+    print(f"index: {len(index['chunks_by_id'])} chunks (scale={args.scale}x) in "
+          f"{time.perf_counter() - t0:.2f}s "
+          f"(embeddings={args.embeddings}, entity tier={'off' if args.no_entity else 'on'})")
+    base = index["retrieval"]
+    bm25 = BM25Index(index["raw_docs_by_bucket"]["all"], k1=cf.BM25_K1, b=cf.BM25_B)
+    logger = logging.getLogger(cf.APP_LOGGER_NAME)
+    with open(QUESTIONS_PATH, encoding="utf-8") as f:
+        questions = json.load(f)
+
+    print(f"{'profile':<22} " + " ".join(f"{'recall@' + str(n):>9}" for n in cutoffs)
+          + f" {'MRR@' + str(cutoffs[-1]):>7} {'recall@k':>9} "
+          f"{'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7}  tiers")
+    for label, profiles in _profile_sets(cf).items():
+        retrievers, hybrids = index_builder.build_retrievers(index["db"], bm25, profiles)
+        retrieval = rt.TieredRetrieval(
+            retrievers, None if args.no_entity else base.entity_index, base.keyword_index,
+            top_k=cf.TOP_K, hybrids=hybrids, rrf_k=cf.RRF_K)
+        recall_at = {n: [] for n in cutoffs}
+        mrr, recall_k, times, tiers = [], [], [], Counter()
+        for q in questions:
+            mode = None if q["mode"] == "all" else q["mode"]
+            k = rt.profile_for(q["mode"], profiles)["k"]
+            query_norm = normalize_text(q["question"])
+            for _ in range(args.repeat):
+                qv = _QueryVector(index["embeddings"], q["question"], query_norm, logger)
+                qv.get()  # 埋め込みは検索時間から除く（2回目以降は質問ベクトルキャッシュから）
+                t = time.perf_counter()
+                result = retrieval.retrieve(q["question"], query_norm, mode, qv)
+                times.append((time.perf_counter() - t) * 1000)
+            for n in cutoffs:
+                recall_at[n].append(_recall(result.docs, q["expected"], n))
+            mrr.append(_reciprocal_rank(result.docs, q["expected"], cutoffs[-1]))
+            recall_k.append(_recall(result.docs, q["expected"], k))
+            tiers[result.tier or "none"] += 1
+        times.sort()
+        print(f"{label:<22} " + " ".join(f"{statistics.mean(recall_at[n]):>9.3f}" for n in cutoffs)
+              + f" {statistics.mean(mrr):>7.3f} {statistics.mean(recall_k):>9.3f} "
+              f"{statistics.mean(times):>8.2f} {_percentile(times, 0.5):>7.2f} "
+              f"{_percentile(times, 0.95):>7.2f}  "
+              + ", ".join(f"{t}={n}" for t, n in sorted(tiers.items())))
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
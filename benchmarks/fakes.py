@@ -0,0 +1,99 @@
+"""
+fakes.py
+ベンチマーク・評価用のオフライン代替クライアント（外部 API を呼ばない）
+"""
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[^\W\da-z_]")  # 英数字の語 / それ以外は1文字
+
+
+class HashEmbeddings(Embeddings):
+    """
+    文字 bi-gram を特徴ハッシュで dim 次元に写像した単位ベクトル
+    （意味は理解しないが、表記が近い文ほど近くなるので検索経路の評価に使える）
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim  # 次元数
+        self.calls = 0  # 埋め込んだテキスト数
+
+    def _vector(self, text: str):
+        s = unicodedata.normalize("NFKC", text or "").lower()
+        toks = _TOKEN_RE.findall(s)
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for gram in toks + [a + b for a, b in zip(toks, toks[1:])]:
+            h = int.from_bytes(hashlib.md5(gram.encode("utf-8")).digest()[:8], "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) == 0 else -1.0
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._vector(text)
+
+
+class StubChatModel(BaseChatModel):
+    """
+    固定の回答を返す LLM（latency 秒待ってから最初のトークン、以降 token_latency 秒ごとに1トークン）
+    usage_metadata のトークン数は文字数で代用する
+    """
+
+    response: str = "ベンチマーク用の回答です。"  # 返す回答
+    latency: float = 0.0  # 最初のトークンまでの待ち時間（秒）
+    token_latency: float = 0.0  # トークン間の待ち時間（秒）
+    chunk_chars: int = 4  # 1トークンの文字数（ストリーミング時）
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _pieces(self):
+        return [self.response[i:i + self.chunk_chars]
+                for i in range(0, len(self.response), self.chunk_chars)]
+
+    def _usage(self, messages):
+        n_in = sum(len(str(m.content)) for m in messages)
+        return {"input_tokens": n_in, "output_tokens": len(self.response),
+                "total_tokens": n_in + len(self.response)}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency + self.token_latency * max(0, len(self._pieces()) - 1))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        pieces = self._pieces()
+        for i, piece in enumerate(pieces):
+            if i:
+                time.sleep(self.token_latency)
+            usage = self._usage(messages) if i == len(pieces) - 1 else None  # 最後のチャンクに付ける
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):  # 待ちの間もループを止めない
+        await asyncio.sleep(self.latency + self.token_latency * max(0, len(self._pieces()) - 1))
+        message = AIMessage(content=self.response, usage_metadata=self._usage(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        pieces = self._pieces()
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            usage = self._usage(messages) if i == len(pieces) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
@@ -0,0 +1,113 @@
+"""
+bm25_index.py
+チャンクの BM25 全文検索インデックス（外部 API 不要）
+日本語は文字 bi-gram、英数字（研究室ID など）は語単位でトークン化し、
+語 → (チャンク番号, 重み) を列方向に並べた疎行列（CSC 形式相当）で一括スコア計算する
+"""
+import re
+from collections import Counter
+
+import numpy as np
+
+from keyword_index import normalize_text
+
+_ASCII_RE = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")  # 英数字の語（lab-02 などは連結のまま）
+_ASCII_PART_RE = re.compile(r"[a-z0-9]+")  # 連結語の構成要素
+_TEXT_RUN_RE = re.compile(r"[^\W\da-z_]+")  # 英数字以外の文字の連続（日本語など）
+
+
+def tokenize(text: str) -> list[str]:  # BM25 用トークン化
+    """
+    正規化後、英数字は語単位（連結語は構成要素も追加）、
+    それ以外の文字列は2文字ずつの bi-gram（1文字だけならその文字）に分ける
+    """
+    s = normalize_text(text)
+    tokens = []
+    for m in _ASCII_RE.finditer(s):
+        word = m.group(0)
+        tokens.append(word)
+        parts = _ASCII_PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for m in _TEXT_RUN_RE.finditer(s):
+        run = m.group(0)
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25。インデックス作成時に語ごとの重み（idf × tf 正規化）まで計算しておき、
+    検索時は質問の語の列を足し合わせるだけにする
+    - 語 t の投稿は doc_ids[indptr[t]:indptr[t + 1]] / weights[同範囲]
+    - bucket 指定時はその bucket のチャンクのみ（該当チャンクがない bucket は全体）
+    """
+
+    def __init__(self, chunks, k1: float = 1.5, b: float = 0.75):
+        self.chunks = list(chunks)  # チャンク（番号 = 取り込み順）
+        self.k1 = k1
+        self.b = b
+        n = len(self.chunks)
+        self._vocab = {}  # 語 → 列番号
+        term_col, doc_col, tf_col = [], [], []  # (語, チャンク, 出現回数) の三つ組
+        doc_len = np.zeros(n, dtype=np.float32)  # チャンクのトークン数
+        buckets = {}  # bucket → チャンク番号一覧
+        for i, c in enumerate(self.chunks):
+            counts = Counter(tokenize(c.page_content))
+            doc_len[i] = sum(counts.values())
+            for tok, tf in counts.items():
+                term_col.append(self._vocab.setdefault(tok, len(self._vocab)))
+                doc_col.append(i)
+                tf_col.append(tf)
+            bucket = (c.metadata or {}).get("bucket")
+            if bucket:
+                buckets.setdefault(bucket, []).append(i)
+
+        terms = np.asarray(term_col, dtype=np.int64)
+        docs = np.asarray(doc_col, dtype=np.int32)
+        tfs = np.asarray(tf_col, dtype=np.float32)
+        order = np.argsort(terms, kind="stable")  # 語ごとにまとめる（CSC 化）
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        df = np.bincount(terms, minlength=len(self._vocab)).astype(np.float32)  # 文書頻度
+        self._indptr = np.concatenate(([0], np.cumsum(df))).astype(np.int64)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        avgdl = float(doc_len.mean()) if n and doc_len.mean() > 0 else 1.0
+        norm = k1 * (1.0 - b + b * doc_len[docs] / avgdl)
+        self._doc_ids = docs  # 投稿のチャンク番号
+        self._weights = (idf[terms] * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32)  # 投稿の重み
+        self._masks = {}  # bucket → 対象チャンクのマスク
+        for bucket, ids in buckets.items():
+            mask = np.zeros(n, dtype=bool)
+            mask[ids] = True
+            self._masks[bucket] = mask
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def scores(self, query: str) -> np.ndarray:  # 全チャンクのスコア
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for tok in set(tokenize(query)):
+            col = self._vocab.get(tok)
+            if col is None:
+                continue
+            start, end = self._indptr[col], self._indptr[col + 1]
+            scores[self._doc_ids[start:end]] += self._weights[start:end]  # 同じ語の投稿はチャンク重複なし
+        return scores
+
+    def search(self, query: str, bucket: str | None = None, limit: int = 15):
+        """[(チャンク, スコア)] をスコア順（同点は取り込み順）に最大 limit 件返す"""
+        if not self.chunks:
+            return []
+        scores = self.scores(query)
+        mask = self._masks.get(bucket) if bucket else None
+        hit = scores > 0
+        if mask is not None:
+            hit &= mask
+        idx = np.flatnonzero(hit)
+        if idx.size > limit:  # 上位 limit 件だけ並べ替える
+            idx = idx[np.argpartition(-scores[idx], limit - 1)[:limit]]
+        idx = idx[np.lexsort((idx, -scores[idx]))]
+        return [(self.chunks[i], float(scores[i])) for i in idx]
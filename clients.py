@@ -0,0 +1,91 @@
+"""
+clients.py
+LLM / 埋め込みクライアントの共有レジストリ
+（プロセス内で1つずつ生成して使い回し、HTTP 接続は keep-alive でプールする。
+同期呼び出し（invoke / embed_query）と非同期呼び出し（ainvoke / aembed_query / astream）で
+それぞれ共有 HTTP クライアントを持ち、接続数・タイムアウトは同じ設定を使う）
+"""
+import threading
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+import config as cf
+from async_runner import RUNNER
+
+_LOCK = threading.RLock()  # 生成処理の排他（LLM 生成中に HTTP クライアントを生成するため再入可）
+_CLIENTS = {}  # 名前 → クライアント
+
+
+def _get_or_create(name: str, factory):  # 未生成なら1回だけ生成
+    client = _CLIENTS.get(name)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(name)
+            if client is None:
+                client = factory()
+                _CLIENTS[name] = client
+    return client
+
+
+def _limits() -> httpx.Limits:  # 接続プールの上限
+    return httpx.Limits(
+        max_connections=cf.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=cf.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=cf.HTTP_KEEPALIVE_EXPIRY_SEC,
+    )
+
+
+def _timeout() -> httpx.Timeout:  # 応答・接続のタイムアウト
+    return httpx.Timeout(cf.HTTP_TIMEOUT_SEC, connect=cf.HTTP_CONNECT_TIMEOUT_SEC)
+
+
+def get_http_client() -> httpx.Client:  # 共有 HTTP クライアント（接続プール）
+    return _get_or_create("http", lambda: httpx.Client(limits=_limits(), timeout=_timeout()))
+
+
+def get_async_http_client() -> httpx.AsyncClient:  # 共有非同期 HTTP クライアント（接続プール）
+    """非同期経路（async_runner.RUNNER のイベントループ）から使う"""
+    return _get_or_create("http_async", lambda: httpx.AsyncClient(limits=_limits(), timeout=_timeout()))
+
+
+def get_llm():  # 共有 LLM クライアント
+    return _get_or_create("llm", lambda: ChatOpenAI(
+        model_name=cf.MODEL_NAME,
+        temperature=cf.TEMPERATURE,
+        openai_api_base=cf.OPENAI_BASE_URL,
+        max_retries=cf.LLM_MAX_RETRIES,
+        stream_usage=True,  # ストリーミング時もトークン数を受け取る（トレース用）
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    ))
+
+
+def get_embeddings():  # 共有埋め込みクライアント
+    return _get_or_create("embeddings", lambda: OpenAIEmbeddings(
+        model=cf.EMBEDDING_MODEL_NAME,
+        openai_api_base=cf.OPENAI_BASE_URL,
+        max_retries=cf.LLM_MAX_RETRIES,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+    ))
+
+
+def register(name: str, client):  # クライアントの差し替え（ベンチマーク・オフライン実行用）
+    """name は "llm" / "embeddings" / "http" / "http_async" のいずれか"""
+    with _LOCK:
+        _CLIENTS[name] = client
+
+
+def reset():  # 全クライアント破棄（HTTP 接続も閉じる）
+    with _LOCK:
+        http = _CLIENTS.pop("http", None)
+        http_async = _CLIENTS.pop("http_async", None)
+        _CLIENTS.clear()
+    if isinstance(http, httpx.Client):
+        http.close()
+    if isinstance(http_async, httpx.AsyncClient):
+        try:  # 接続は共有イベントループ上で開いたものなので、そこで閉じる
+            RUNNER.run(http_async.aclose(), timeout=cf.HTTP_CONNECT_TIMEOUT_SEC)
+        except Exception:  # 閉じられなければ破棄に任せる
+            pass
@@ -3,9 +3,10 @@ config.py
 固定の文字列や数値をまとめる
 """
 from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader, TextLoader
-from langchain_community.document_loaders.csv_loader import CSVLoader
 import os
 
+from csv_ingest import PandasCSVLoader
+
 # 画面表示系
 APP_TITLE = "Campus Guide AI"
 DESCRIPTION = "学内情報検索機能を備えた教育向けAIアシスタントです。"
@@ -17,28 +18,123 @@ CHAT_INPUT_PLACEHOLDER = "ここにメッセージを入力してください。
 LOG_DIR = "./logs"
 APP_LOGGER_NAME = "app_logger"
 LOG_FILE = "app.log"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")   # 本番で INFO にすると DEBUG ログの整形コストがかからない
+TRACE_ENABLED = True                # 質問ごとの処理時間トレース（JSON 1行）を出力するか
+TRACE_LOGGER_NAME = "app_trace"
+TRACE_LOG_FILE = "trace.jsonl"      # 集計: python tracing.py logs/trace.jsonl*
 APP_START_MESSAGE = "アプリが正常に起動しました。"
 
 # LLM
 MODEL_NAME = "gpt-4o-mini"
 MAX_TOKENS = 100
 TOP_K = 15                 # まとめ系に効くよう広めに
+CONTEXT_TOKEN_BUDGET = 3000   # プロンプトの【文脈】に入れるチャンクの合計トークン上限
 TEMPERATURE = 0.5
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None   # None なら OpenAI 既定のエンドポイント
+LLM_MAX_RETRIES = 2
 VECTORSTORE_DIR = "./vectorstore"
+MANIFEST_PATH = "./vectorstore/manifest.json"   # 取り込み済みソースの台帳
+VECTOR_COLLECTION_NAME = "chunks"   # 全チャンクを1件ずつ保存（モードは bucket メタデータで絞り込み）
 EMBEDDING_MODEL_NAME = "text-embedding-ada-002"
 CHUNK_OVERLAP = 50
 CHUNK_SIZE = 500
 CHUNK_SEPARATOR = "\n"
 
+# 検索結果キャッシュ（正規化クエリ, mode, k → チャンクID）
+RETRIEVAL_CACHE_MAX_ENTRIES = 2048  # 件数上限（LRU）
+RETRIEVAL_CACHE_TTL_SEC = 600       # 有効期限（秒）
+RETRIEVAL_CACHE_LOG_EVERY = 50      # 何回の検索ごとにヒット率をログに出すか
+QUERY_EMBED_CACHE_MAX_ENTRIES = 4096  # 質問ベクトルキャッシュの件数上限
+QUERY_EMBED_CACHE_TTL_SEC = 3600      # 質問ベクトルキャッシュの有効期限（秒）
+
+# 回答キャッシュ（言い回し違いの同じ質問 + 同じ参照チャンク → 保存済み回答）
+ANSWER_CACHE_MAX_ENTRIES = 512      # 件数上限（LRU）
+ANSWER_CACHE_SIMILARITY = 0.95      # 同じ質問とみなすコサイン類似度
+
+# HTTP 接続プール（LLM / 埋め込みクライアントで共有）
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE = 10
+HTTP_KEEPALIVE_EXPIRY_SEC = 60
+HTTP_TIMEOUT_SEC = 60
+HTTP_CONNECT_TIMEOUT_SEC = 10
+
+# 埋め込みキャッシュ（モデル名 + 本文ハッシュ → ベクトル）
+EMBED_CACHE_PATH = "./cache/embeddings.sqlite3"
+EMBED_CACHE_MAX_ENTRIES = 200_000   # 件数上限（超過分はアクセスが古い順に削除）
+EMBED_CACHE_MAX_AGE_DAYS = 90       # 最終アクセスからの保持期間（None で無期限）
+EMBED_BATCH_SIZE = 256              # キャッシュミス分を埋め込むバッチサイズ（取り込みもこの単位で流す）
+INGEST_PROGRESS_EVERY = 10          # 取り込み進捗をログに出す間隔（バッチ数）
+
 # RAGデータ
 RAG_ROOT_PATH = "./data"
+CSV_METADATA_COLUMNS = (   # CSV 行チャンクのメタデータに載せる列（存在する列のみ）
+    "学部名", "学科名", "研究室ID", "研究室名", "指導教員",
+)
 ALLOWED_EXTENSIONS = {
     ".pdf": PyMuPDFLoader,
     ".docx": Docx2txtLoader,
-    ".csv": lambda path: CSVLoader(path, encoding="utf-8"),
+    ".csv": lambda path: PandasCSVLoader(path, metadata_columns=CSV_METADATA_COLUMNS),
     ".txt": lambda path: TextLoader(path, encoding="utf-8"),
 }
 
+# ファイル解析の並列化（PDF/DOCX 解析は CPU 律速のためプロセスプールで実行）
+LOADER_WORKERS = max(1, (os.cpu_count() or 2) - 1)   # 1 以下なら逐次解析
+# spawn したワーカーは langchain・ローダーの import からやり直す（起動に数秒）ため、
+# 解析の重い拡張子の合計サイズがこれ未満ならプールを起動しない（同梱の data/ は 1MB 弱で逐次）
+LOADER_PARALLEL_EXTENSIONS = (".pdf", ".docx")
+LOADER_PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+LOADER_QUEUE_SIZE = 16          # 解析済み→チャンク分割へ渡すキューの上限
+
+# エンティティ完全一致検索（質問がほぼ名前だけなら埋め込み検索を省略。
+# 名前以外の語を含む質問は名前のチャンクを先頭側に統合したうえで通常の検索も行う）
+ENTITY_FIELDS = (
+    "学部名", "学科名", "研究室ID", "研究室名", "指導教員",
+    "施設名", "イベント名", "証明書名",
+)
+ENTITY_QUERY_FILLERS = (   # 名前だけの質問とみなすときに無視する定型句
+    "について", "とは", "を教えてください", "教えてください", "を教えて", "教えて",
+    "の情報", "の概要", "の詳細", "ください", "は", "を", "の", "って",
+    "?", "？", "。", "、", "!", "！",
+)
+
+# キーワードFallback（文字 bi-gram 転置インデックス）
+# 質問にキーが含まれていれば、値の語を含むチャンクもヒットさせる（キー自身も値に含める）
+KEYWORD_SYNONYMS = {
+    "環境工学": ("環境工学", "環境"),
+    "奨学金": ("奨学金", "支援", "学費"),
+}
+KEYWORD_QUERY_WEIGHT = 2.0     # 質問全体が一致した場合の重み（類義語は 1.0）
+
+# 検索プロファイル（mode ごとの候補数・検索方式。"default" を mode ごとの値で上書き）
+# retriever: "vector"（埋め込みのみ） | "hybrid"（BM25 + 埋め込みを RRF で統合）
+# search_type: "mmr" | "similarity" | "similarity_score_threshold"
+# fetch_k: MMR で多様化する前に取る候補数（k 以下だと多様化しない）
+# lambda_mult: MMR の関連度と多様性の比重（1.0 で関連度のみ）
+# score_threshold: similarity_score_threshold のときの関連度下限（0〜1）
+# 既定は hybrid + similarity（benchmarks/eval_retrieval.py で recall・速度とも MMR を上回った。
+# MMR に切り替える mode は lambda_mult 0.9 未満だと複製の多いコーパスで recall が落ちる）
+RETRIEVAL_PROFILES = {
+    "default": {
+        "retriever": "hybrid",
+        "search_type": "similarity",
+        "k": TOP_K,
+        "fetch_k": TOP_K * 2,      # search_type="mmr" のときのみ使用
+        "lambda_mult": 0.9,        # search_type="mmr" のときのみ使用
+        "score_threshold": None,
+    },
+}
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60                       # RRF の順位補正（大きいほど下位も効く）
+HYBRID_VECTOR_TIMEOUT_SEC = 3.0  # ベクトル側（埋め込み + 検索）の待ち時間上限。超えたら BM25 のみ
+HYBRID_VECTOR_WORKERS = 8        # ベクトル側を実行するスレッド数（非同期経路の並行検索 'all' + 4バケットが待たない数）
+
+# --- 非同期の回答経路（rag_engine.RagEngine.aanswer / astream） ---
+ASYNC_RAG = True                   # 画面からの回答生成を非同期経路で行う
+RETRIEVAL_CALL_TIMEOUT_SEC = 5.0   # 非同期経路の検索1回の待ち時間上限。超えた検索は除く
+QUERY_EMBED_TIMEOUT_SEC = 5.0      # 質問の埋め込みの待ち時間上限。超えたらベクトル検索なし（BM25 等のみ）
+ASYNC_THREAD_WORKERS = 16          # 非同期経路で同期処理（検索）を実行するスレッド数
+
 # --- フォルダ判定用キー（パスの一部に含めてください） ---
 FOLDER_KEY_FACULTY = "faculty"     # ./data/faculty/...
 FOLDER_KEY_DEPARTMENT = "department"  # ./data/department/...
@@ -55,6 +151,8 @@ CRAWL_USER_AGENT = os.getenv(
 HISTORY_DIR = "./histories"
 AUTOSAVE_HISTORY = True
 MAX_HISTORY_MESSAGES = 50   # 保存上限（画面表示はhelpers側）
+HISTORY_COMPACT_FACTOR = 2  # 履歴ファイルの行数が 上限 × この値 を超えたら末尾の上限件数に圧縮
+WRITE_BEHIND_QUEUE_SIZE = 256   # 履歴保存のバックグラウンド書き込みキューの上限（ユーザー単位でまとめる）
 
 # メッセージ
 ERROR_MSG_GENERAL = "エラーが発生しました。再度お試しください。解決しない場合は管理者へお問い合わせください。"
@@ -0,0 +1,85 @@
+"""
+context_builder.py
+検索結果のチャンクを、重複を除きつつ上位から順にトークン予算内へ詰めて文脈を作る
+"""
+import re
+import threading
+
+import tiktoken
+
+import config as cf
+
+_WS_RE = re.compile(r"\s+")  # 重複判定用の空白正規化
+
+
+class ContextBuilder:
+    """
+    tiktoken でトークン数を数え、budget 以内に収まるチャンクだけで文脈を組み立てる
+    - チャンクのトークン数は取り込み時にメタデータ token_count として保存済み（なければ計算して保持）
+    - 本文が同じチャンク（空白の違いのみ含む）は1つにまとめる
+    - エンコーディングを読み込めない環境（オフライン等）では文字数で多めに見積もる
+    """
+
+    def __init__(self, model_name: str, budget: int, separator: str = "\n\n"):
+        self.model_name = model_name  # エンコーディング判定用のモデル名
+        self.budget = budget  # 文脈に使える最大トークン数
+        self.separator = separator  # チャンク間の区切り
+        self._encoding = None  # tiktoken エンコーディング（初回使用時に読み込み）
+        self.encoding_name = None  # 使用中のエンコーディング名（"approx" は文字数見積もり）
+        self._lock = threading.Lock()
+        self._sep_tokens = None  # 区切り文字列のトークン数
+
+    def _get_encoding(self):  # エンコーディング取得（読み込みは1回だけ）
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    try:
+                        try:
+                            encoding = tiktoken.encoding_for_model(self.model_name)
+                        except KeyError:  # 未知のモデル名
+                            encoding = tiktoken.get_encoding("o200k_base")
+                        self.encoding_name = encoding.name
+                    except Exception:  # BPE ファイルを取得できない
+                        encoding = False
+                        self.encoding_name = "approx"
+                    self._encoding = encoding
+        return self._encoding
+
+    def count(self, text: str) -> int:  # トークン数
+        encoding = self._get_encoding()
+        if not encoding:  # 見積もり（日本語は概ね1文字1トークン以下）
+            return len(text or "")
+        return len(encoding.encode(text or "", disallowed_special=()))
+
+    def count_chunk(self, doc) -> int:  # チャンクのトークン数（保存済みならそれを使う）
+        n = (doc.metadata or {}).get("token_count")
+        if not isinstance(n, int):
+            n = self.count(doc.page_content)
+            doc.metadata["token_count"] = n  # 次回以降は再計算しない
+        return n
+
+    def build(self, docs):  # 文脈の組み立て
+        """
+        docs（ランキング順）から (文脈文字列, 採用チャンク, 使用トークン数) を返す
+        予算に収まらないチャンクは飛ばし、後続の短いチャンクで残りを埋める
+        """
+        if self._sep_tokens is None:
+            self._sep_tokens = self.count(self.separator)
+        used, seen, total = [], set(), 0
+        for doc in docs:
+            key = (doc.metadata or {}).get("chunk_id") or _WS_RE.sub(" ", doc.page_content).strip()
+            text_key = _WS_RE.sub(" ", doc.page_content).strip()
+            if key in seen or text_key in seen:  # 重複除去
+                continue
+            seen.update((key, text_key))
+            cost = self.count_chunk(doc) + (self._sep_tokens if used else 0)
+            if total + cost > self.budget:  # 予算超過なら飛ばす
+                continue
+            used.append(doc)
+            total += cost
+        context = self.separator.join(d.page_content for d in used)
+        return context, used, total
+
+
+CONTEXT_BUILDER = ContextBuilder(  # プロセス共有インスタンス
+    model_name=cf.MODEL_NAME, budget=cf.CONTEXT_TOKEN_BUDGET)
@@ -0,0 +1,45 @@
+"""
+csv_ingest.py
+CSV を pandas で一括読み込みし、1行 = 1チャンクの Document を列単位の演算で組み立てる
+"""
+import pandas as pd
+from langchain_core.documents import Document
+
+RECORD_TYPE_CSV_ROW = "csv_row"  # CSV 行チャンクの record_type
+
+
+class PandasCSVLoader:
+    """
+    CSV ローダー（LangChain の CSVLoader と同じ「列名: 値」形式の本文を作る）
+    - BOM 付き UTF-8 も読める（utf-8-sig）
+    - metadata_columns に挙げた列が存在すれば、その値をメタデータに入れる
+    """
+
+    def __init__(self, path: str, metadata_columns=(), encoding: str = "utf-8-sig"):
+        self.path = path  # CSVファイルパス
+        self.metadata_columns = tuple(metadata_columns)  # メタデータに載せる列
+        self.encoding = encoding  # 文字コード
+
+    def load(self) -> list[Document]:  # 読み込み
+        df = pd.read_csv(self.path, dtype=str, keep_default_na=False,
+                         encoding=self.encoding, skipinitialspace=True)
+        if df.empty:
+            return []
+        df.columns = [str(c).lstrip("\ufeff").strip() for c in df.columns]  # BOM・空白除去
+        df = df.apply(lambda col: col.str.strip())  # 値の前後空白を列ごとに除去
+
+        content = None  # 「列名: 値」を改行で連結した本文（列単位で一括生成）
+        for col in df.columns:
+            part = f"{col}: " + df[col]
+            content = part if content is None else content + "\n" + part
+
+        meta_cols = [c for c in self.metadata_columns if c in df.columns]
+        meta_rows = df[meta_cols].to_dict("records") if meta_cols else [{}] * len(df)
+        return [
+            Document(
+                page_content=text,
+                metadata={"source": self.path, "row": i,
+                          "record_type": RECORD_TYPE_CSV_ROW, **meta},
+            )
+            for i, (text, meta) in enumerate(zip(content.tolist(), meta_rows))
+        ]
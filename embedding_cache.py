@@ -0,0 +1,160 @@
+"""
+embedding_cache.py
+チャンク本文の埋め込みベクトルを永続キャッシュし、未変更チャンクの再埋め込みを防ぐ
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+_LOOKUP_BATCH = 500  # SQLite の IN 句に渡す最大件数
+
+
+def normalize_for_key(text: str) -> str:  # キャッシュキー用の正規化
+    """改行コード・前後空白・Unicode表記ゆれを吸収する"""
+    s = unicodedata.normalize("NFC", text or "")  # Unicode正規化
+    s = s.replace("\r\n", "\n").replace("\r", "\n")  # 改行コード統一
+    return s.strip()  # 前後空白削除
+
+
+def make_key(model: str, text: str) -> str:  # キャッシュキー生成
+    """(モデル名, 正規化本文のハッシュ) からキーを作る"""
+    digest = hashlib.sha256(normalize_for_key(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    SQLite に (モデル名, 本文ハッシュ) → ベクトル を保存する埋め込みラッパー
+    - embed_documents: 一括ルックアップし、ミス分だけまとめて埋め込む
+    - 件数上限・保持期間で古いものから削除（起動時と、インデックス構築ごとに evict() を1回）
+    - ヒット/ミス件数は stats() で取得
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, path: str,
+                 max_entries: int = 100_000, max_age_days: float | None = None,
+                 batch_size: int = 256):
+        self.underlying = underlying  # 実際の埋め込みクライアント
+        self.model_name = model_name  # キーに含めるモデル名
+        self.path = path  # キャッシュDBのパス
+        self.max_entries = max_entries  # 保存件数上限
+        self.max_age_days = max_age_days  # 保持期間（日）。None なら無期限
+        self.batch_size = batch_size  # ミス分を埋め込むときのバッチサイズ
+        self.hits = 0  # ヒット件数
+        self.misses = 0  # ミス件数
+        self._lock = threading.Lock()  # 接続・カウンタ保護
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)  # フォルダ作成
+        self._conn = sqlite3.connect(path, check_same_thread=False)  # スレッド間で共有
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings(accessed_at)")
+        self._conn.commit()
+        self.evict()  # 起動時に期限切れを掃除
+
+    # ===== Embeddings インターフェース =====
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [make_key(self.model_name, t) for t in texts]  # キー生成
+        found = self._lookup(set(keys))  # 一括ルックアップ
+
+        missing = {}  # key → 代表本文（同一本文はまとめて1回だけ埋め込む）
+        for k, t in zip(keys, texts):
+            if k not in found:
+                missing.setdefault(k, t)
+
+        miss_count = sum(1 for k in keys if k not in found)  # ミス件数
+        with self._lock:  # カウンタ更新
+            self.hits += len(keys) - miss_count
+            self.misses += miss_count
+
+        if missing:  # ミス分をまとめて埋め込み
+            miss_keys = list(missing.keys())
+            miss_texts = [missing[k] for k in miss_keys]
+            vectors = []
+            for i in range(0, len(miss_texts), self.batch_size):  # バッチ単位で埋め込み
+                vectors.extend(self.underlying.embed_documents(
+                    miss_texts[i:i + self.batch_size]))
+            new_items = dict(zip(miss_keys, vectors))
+            self._store(new_items)  # 保存
+            found.update(new_items)
+
+        return [found[k] for k in keys]  # 入力順で返す
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)  # 検索クエリはキャッシュしない
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self.underlying.aembed_query(text)  # 非同期クライアントをそのまま使う
+
+    # ===== キャッシュ操作 =====
+
+    def stats(self) -> dict:  # ヒット/ミス集計
+        with self._lock:
+            total = self.hits + self.misses
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "entries": count,
+            }
+
+    def evict(self):  # 期限切れ・上限超過分を削除
+        """保持期間を過ぎたもの、件数上限を超えた古いアクセス順のものを削除"""
+        with self._lock:
+            if self.max_age_days is not None:  # 期限切れ削除
+                cutoff = time.time() - self.max_age_days * 86400
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE accessed_at < ?", (cutoff,))
+            if self.max_entries:  # 件数上限
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+
+    def _lookup(self, keys: set[str]) -> dict:  # 一括ルックアップ
+        found = {}
+        if not keys:
+            return found
+        keys = list(keys)
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), _LOOKUP_BATCH):  # IN 句をバッチ化
+                part = keys[i:i + _LOOKUP_BATCH]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for k, blob in rows:
+                    found[k] = array("f", blob).tolist()  # float32 配列から復元
+                if rows:  # 最終アクセス時刻を更新（LRU削除用）
+                    hit_keys = [k for k, _ in rows]
+                    self._conn.execute(
+                        f"UPDATE embeddings SET accessed_at = ? WHERE key IN ({','.join('?' * len(hit_keys))})",
+                        [now, *hit_keys],
+                    )
+            self._conn.commit()
+        return found
+
+    def _store(self, items: dict):  # 新規ベクトル保存
+        now = time.time()
+        rows = [(k, array("f", v).tobytes(), now, now) for k, v in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
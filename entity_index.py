@@ -0,0 +1,94 @@
+"""
+entity_index.py
+学部名・学科名・研究室ID などのエンティティ名 → チャンク の転置インデックス
+（質問がほぼ名前だけなら埋め込みなしで該当チャンクを返す）
+"""
+import re
+import unicodedata
+
+
+def normalize_name(s: str) -> str:  # エンティティ名の正規化
+    """全角/半角・大文字/小文字・空白の違いを吸収（「山田 太郎」と「山田太郎」を同一視）"""
+    s = unicodedata.normalize("NFKC", s or "").lower()
+    return re.sub(r"\s+", "", s)
+
+
+class EntityIndex:
+    """
+    チャンクのメタデータ（CSV 列）と本文中の「ラベル: 値」行・「● 見出し」行から
+    エンティティ名を集め、名前 → チャンク の対応を作る
+    fillers は「について」「を教えて」など、名前だけの質問に付く定型句（is_name_only で無視する）
+    """
+
+    def __init__(self, chunks, fields, min_length: int = 2, fillers=()):
+        self.fields = tuple(fields)  # エンティティとして扱う項目名
+        fillers = sorted((normalize_name(f) for f in fillers if f), key=len, reverse=True)
+        self._filler_re = re.compile(  # 定型句（長いものを優先して除去）
+            "|".join(re.escape(f) for f in fillers)) if fillers else None
+        field_alt = "|".join(re.escape(f) for f in self.fields)
+        self._line_re = re.compile(  # 「学科名: 機械工学科」形式の行
+            rf"^(?:{field_alt})[:：][ \t　]*(.+?)[ \t　]*$", re.MULTILINE)
+        self._heading_re = re.compile(r"^[●■◆][ \t　]*(.+?)[ \t　]*$", re.MULTILINE)  # 見出し行
+
+        self._postings = {}  # 正規化名 → チャンク一覧
+        for c in chunks:
+            for name in self._names_of(c):
+                key = normalize_name(name)
+                if len(key) < min_length:
+                    continue
+                posting = self._postings.setdefault(key, [])
+                if not posting or posting[-1] is not c:
+                    posting.append(c)
+
+        names = sorted(self._postings, key=len, reverse=True)  # 長い名前を優先して照合
+        self._pattern = re.compile("|".join(re.escape(n) for n in names)) if names else None
+
+    def __len__(self):
+        return len(self._postings)
+
+    def _names_of(self, chunk):  # チャンクに含まれるエンティティ名
+        meta = chunk.metadata or {}
+        for f in self.fields:  # CSV 行由来のメタデータ
+            v = meta.get(f)
+            if isinstance(v, str) and v:
+                yield v
+        text = chunk.page_content or ""
+        yield from (m.group(1) for m in self._line_re.finditer(text))
+        yield from (m.group(1) for m in self._heading_re.finditer(text))
+
+    def match_names(self, query: str) -> list[str]:  # 質問中のエンティティ名
+        if self._pattern is None:
+            return []
+        seen, names = set(), []
+        for m in self._pattern.finditer(normalize_name(query)):
+            if m.group(0) not in seen:
+                seen.add(m.group(0))
+                names.append(m.group(0))
+        return names
+
+    def is_name_only(self, query: str) -> bool:  # 質問がエンティティ名（+ 定型句）だけか
+        """例：「工学部」「工学部について教えて」は True、「工学部の奨学金」は False"""
+        if self._pattern is None:
+            return False
+        rest, n = self._pattern.subn("", normalize_name(query))
+        if self._filler_re is not None:
+            rest = self._filler_re.sub("", rest)
+        return n > 0 and not rest
+
+    def lookup(self, query: str, bucket: str | None = None, limit: int | None = None):  # 検索
+        """
+        質問に含まれるエンティティ名のチャンクを返す（見つからなければ空リスト）
+        bucket 指定時はその bucket のチャンクだけを返す
+        """
+        hits, seen = [], set()
+        for name in self.match_names(query):
+            for c in self._postings[name]:
+                if bucket and (c.metadata or {}).get("bucket") != bucket:
+                    continue
+                if id(c) in seen:
+                    continue
+                seen.add(id(c))
+                hits.append(c)
+                if limit and len(hits) >= limit:
+                    return hits
+        return hits
@@ -6,6 +6,8 @@ import os
 import json
 import streamlit as st
 import config as cf
+import history_store as hs
+import tracing
 
 
 def show_initial_ai_message():  # 初期メッセージ表示
@@ -23,10 +25,12 @@ def _trim_history_inplace():  # 履歴のトリム
 def append_message(role: str, content: str):  # メッセージ追加
     """履歴に追記し、必要なら自動保存"""
     st.session_state.setdefault("messages", [])  # メッセージ履歴初期化
-    st.session_state.messages.append({"role": role, "content": content})  # 追加
+    message = {"role": role, "content": content}
+    st.session_state.messages.append(message)  # 追加
     _trim_history_inplace()  # トリム
     if getattr(cf, "AUTOSAVE_HISTORY", True):  # 自動保存設定
-        _autosave_history()  # 自動保存
+        with tracing.span("history_save"):
+            _autosave_history([message])  # 自動保存（追記のみ）
 
 
 def render_conversation_log():  # 会話ログ表示
@@ -45,31 +49,57 @@ def render_conversation_log():  # 会話ログ表示
 # ===== ユーザーごとの履歴 永続化 =====
 
 
-def _history_path(user_id: str) -> str:  # 履歴ファイルパス
-    os.makedirs(cf.HISTORY_DIR, exist_ok=True)  # フォルダ作成
-    safe = user_id.replace("/", "_").replace("\\",
-                                             "_").strip() or "default"  # 安全なファイル名
-    return os.path.join(cf.HISTORY_DIR, f"{safe}.json")  # 履歴ファイルパス
+def _history_key(user_id: str) -> str:  # 履歴の保存キー
+    """ユーザーID。未入力ならセッションID（匿名セッション同士で同じファイルに追記しない）"""
+    user_id = (user_id or "").strip()
+    return user_id or f"_anon_{st.session_state.get('session_id', 'default')}"
 
 
-def _autosave_history():  # 履歴自動保存
-    user_id = st.session_state.get("user_id", "") or "default"  # ユーザーID取得
-    path = _history_path(user_id)  # 履歴ファイルパス
-    with open(path, "w", encoding="utf-8") as f:  # ファイル書き込み
-        json.dump(st.session_state.get("messages", []), f,
-                  ensure_ascii=False, indent=2)  # JSON保存
+def _history_path(user_id: str, ext: str = ".jsonl") -> str:  # 履歴ファイルパス（フォルダは書き込み時に作成）
+    safe = _history_key(user_id).replace("/", "_").replace("\\", "_")  # 安全なファイル名
+    return os.path.join(cf.HISTORY_DIR, f"{safe}{ext}")  # 履歴ファイルパス
+
+
+def _current_user() -> str:  # 保存先ユーザーID（未入力なら空文字）
+    return st.session_state.get("user_id", "")
+
+
+def _autosave_history(new_messages: list):  # 履歴自動保存
+    """追加分だけを JSON Lines に追記（バックグラウンドで実行。行数が増えたら上限件数に圧縮）"""
+    hs.submit_append(_history_path(_current_user()), new_messages,
+                     max_messages=cf.MAX_HISTORY_MESSAGES, compact_factor=cf.HISTORY_COMPACT_FACTOR)
+
+
+def save_history():  # 履歴保存（現在の messages で置き換え。バックグラウンドで実行）
+    hs.submit_replace(_history_path(_current_user()), st.session_state.get("messages", []))
+
+
+def clear_history():  # 履歴クリア
+    st.session_state.messages = []  # 履歴初期化
+    if getattr(cf, "AUTOSAVE_HISTORY", True):  # 自動保存設定
+        save_history()  # 保存済みの履歴も空にする
+
+
+def _migrate_legacy(user_id: str, path: str):  # 旧形式（JSON 配列）の履歴を JSON Lines に移行
+    legacy = _history_path(user_id, ext=".json")
+    if os.path.exists(path) or not os.path.exists(legacy):
+        return
+    with open(legacy, "r", encoding="utf-8") as f:  # ファイル読み込み
+        messages = json.load(f)  # JSON読み込み
+    hs.replace(path, messages[-cf.MAX_HISTORY_MESSAGES:])
+    os.remove(legacy)
 
 
 def load_history(user_id: str):  # 履歴読み込み
-    """指定ユーザーの履歴を読み込んで messages にセット"""
+    """指定ユーザーの履歴（末尾の上限件数のみ）を読み込んで messages にセット"""
     path = _history_path(user_id)  # 履歴ファイルパス
-    if os.path.exists(path):  # ファイルがあれば
-        try:  # 読み込み
-            with open(path, "r", encoding="utf-8") as f:  # ファイル読み込み
-                st.session_state.messages = json.load(f)  # JSON読み込み
-            _trim_history_inplace()  # トリム
+    try:  # 読み込み
+        hs.flush()  # 未書き込みの保存を先に済ませる
+        _migrate_legacy(user_id, path)
+        if os.path.exists(path):  # ファイルがあれば
+            st.session_state.messages = hs.read_tail(path, cf.MAX_HISTORY_MESSAGES)  # 末尾のみ
             return True  # 読み込み成功
-        except Exception:  # 読み込み失敗
-            pass  # 失敗時の処理
+    except Exception:  # 読み込み失敗
+        pass  # 失敗時の処理
     st.session_state.messages = []  # 履歴初期化
     return False  # 読み込み失敗
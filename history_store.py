@@ -0,0 +1,148 @@
+"""
+history_store.py
+会話履歴の JSON Lines 保存（1メッセージ1行の追記のみ。行数が増えたら末尾だけ残して原子的に圧縮）
+submit_* はバックグラウンドの書き込みキューに積むだけで、ディスク I/O を待たない
+"""
+import json
+import os
+import threading
+
+from write_behind import WRITER
+
+_LOCKS = {}  # ファイルパス → ロック（同じユーザーの同時書き込み対策）
+_LOCKS_GUARD = threading.Lock()
+_LINE_COUNTS = {}  # ファイルパス → 行数（圧縮判定用。初回のみ数える）
+
+
+def _lock_for(path: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _LOCKS.setdefault(path, threading.Lock())
+
+
+def _count_lines(path: str) -> int:  # 行数（ファイルがなければ 0）
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 16), b""))
+
+
+def _ends_with_newline(path: str) -> bool:  # 最終行が完結しているか（空ファイルも True）
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _encode(message: dict) -> str:  # 1メッセージ → 1行
+    return json.dumps(message, ensure_ascii=False) + "\n"
+
+
+def _write_atomic(path: str, messages: list):  # 全件書き直し（一時ファイル→置換）
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(_encode(m) for m in messages)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # 途中で落ちても元のファイルは壊れない
+    _LINE_COUNTS[path] = len(messages)
+
+
+def read_tail(path: str, n: int, block_size: int = 8192) -> list:  # 末尾 n 件の読み込み
+    """ファイル末尾からブロック単位で読み、最後の n 件だけを返す（壊れた行は飛ばす）"""
+    if n <= 0 or not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:  # n 件 + 途中の1行分が揃うまで遡る
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if pos > 0:  # 先頭は途中から読んだ行なので捨てる
+        lines = lines[1:]
+    messages = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            messages.append(json.loads(line.decode("utf-8")))
+        except ValueError:  # 書き込み途中で落ちた行
+            continue
+    return messages[-n:]
+
+
+def append(path: str, messages: list, max_messages: int, compact_factor: int = 2):  # 追記
+    """
+    messages を末尾に追記する（既存行は書き換えない）
+    行数が max_messages × compact_factor を超えたら、末尾 max_messages 件で原子的に圧縮
+    """
+    if not messages:
+        return
+    with _lock_for(path):
+        prefix = ""
+        if path not in _LINE_COUNTS:  # このプロセスで初めて書くファイル
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)  # フォルダ作成（ファイルごとに1回）
+            _LINE_COUNTS[path] = _count_lines(path)
+            if not _ends_with_newline(path):  # 前回の書き込み途中で落ちた行を閉じる
+                prefix = "\n"
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(prefix + "".join(_encode(m) for m in messages))  # 1回の write でまとめて追記
+        _LINE_COUNTS[path] += len(messages)
+        if _LINE_COUNTS[path] > max_messages * compact_factor:
+            _write_atomic(path, read_tail(path, max_messages))
+
+
+def replace(path: str, messages: list):  # 全件置き換え（保存ボタン・クリア・旧形式の移行）
+    with _lock_for(path):
+        _write_atomic(path, messages)
+
+
+class _HistoryWrite:
+    """
+    キューに積む1ファイル分の書き込み（同じファイルの未実行分は1つにまとめる）
+    - 追記 + 追記 → まとめて追記
+    - 置き換え + 追記 → 追記分を足して置き換え
+    - 何か + 置き換え → 新しい置き換え
+    """
+
+    def __init__(self, path: str, messages: list, replace_all: bool,
+                 max_messages: int = 0, compact_factor: int = 2):
+        self.path = path
+        self.messages = list(messages)
+        self.replace_all = replace_all  # True なら全件置き換え、False なら追記
+        self.max_messages = max_messages
+        self.compact_factor = compact_factor
+
+    def __call__(self):
+        if self.replace_all:
+            replace(self.path, self.messages)
+        else:
+            append(self.path, self.messages, self.max_messages, self.compact_factor)
+
+    @staticmethod
+    def merge(old, new):
+        if new.replace_all:
+            return new
+        old.messages.extend(new.messages)
+        if not old.replace_all:
+            old.max_messages, old.compact_factor = new.max_messages, new.compact_factor
+        return old
+
+
+def submit_append(path: str, messages: list, max_messages: int, compact_factor: int = 2):  # 追記（非同期）
+    if messages:
+        WRITER.submit(path, _HistoryWrite(path, messages, False, max_messages, compact_factor),
+                      merge=_HistoryWrite.merge)
+
+
+def submit_replace(path: str, messages: list):  # 全件置き換え（非同期）
+    WRITER.submit(path, _HistoryWrite(path, messages, True), merge=_HistoryWrite.merge)
+
+
+def flush():  # 積まれた書き込みの完了待ち（読み込み前に呼ぶ）
+    WRITER.flush()
@@ -0,0 +1,417 @@
+"""
+index_builder.py
+インデックス構築（取り込み → ベクトルDB → 検索用インデックス）とプロセス共有の RAG エンジン
+Streamlit に依存しないため、画面以外（ベンチマーク・別プロセスでの提供）からも使える
+"""
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import unicodedata
+import urllib.parse as urlparse
+import urllib.robotparser as robotparser
+from functools import lru_cache
+
+from langchain_community.document_loaders import WebBaseLoader
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+import clients
+import config as cf
+import index_manifest as im
+import ingest as ing
+import loader_pipeline as lp
+import retrieval as rt
+from answer_cache import ANSWER_CACHE
+from bm25_index import BM25Index
+from context_builder import CONTEXT_BUILDER
+from embedding_cache import CachedEmbeddings
+from entity_index import EntityIndex
+from keyword_index import KeywordIndex
+from rag_engine import RagEngine
+from record_chunker import RecordChunker
+from retrieval_cache import RETRIEVAL_CACHE
+
+_INDEX_LOCK = threading.Lock()  # 共有インデックス構築用ロック（同時初回アクセス対策）
+_SHARED_ENGINE = None  # プロセス共有 RAG エンジン（インデックスを保持。全セッションで読み取り専用として共有）
+_INDEX_VERSION = 0  # 再構築のたびに増える世代番号
+
+
+def get_shared_engine() -> RagEngine:  # 共有 RAG エンジン取得
+    """プロセス内で一度だけインデックスを構築し、エンジンを全セッションで共有する"""
+    global _SHARED_ENGINE, _INDEX_VERSION
+    engine = _SHARED_ENGINE  # 構築済みならロックなしで返す
+    if engine is not None:
+        return engine
+    with _INDEX_LOCK:  # 構築は1スレッドのみ（他の初回訪問者は完了を待つ）
+        if _SHARED_ENGINE is None:  # ロック取得後に再確認
+            _INDEX_VERSION += 1  # 世代番号を更新
+            _SHARED_ENGINE = RagEngine(build_index(_INDEX_VERSION))  # インデックス構築
+        return _SHARED_ENGINE
+
+
+def get_shared_index():  # 共有インデックス取得
+    """共有エンジンが保持するインデックス（build_index の戻り値）"""
+    return get_shared_engine().index
+
+
+def invalidate_shared_index():  # 共有インデックス破棄
+    """データ更新時に呼び出す。次回アクセス時にインデックスを再構築する"""
+    global _SHARED_ENGINE
+    with _INDEX_LOCK:  # 構築中なら完了を待ってから破棄
+        _SHARED_ENGINE = None
+    RETRIEVAL_CACHE.clear()  # 古いインデックスの検索結果を破棄
+    ANSWER_CACHE.clear()  # 古いインデックスに基づく回答を破棄
+
+
+BUCKETS = ["all", "faculty", "department", "research", "campus"]  # 検索モード（all 以外は bucket 値）
+BUCKET_OTHER = "other"  # どのフォルダにも属さないチャンクの bucket 値
+_LEGACY_COLLECTIONS = BUCKETS  # 旧構成（モードごとに1コレクション）のコレクション名
+_ADD_BATCH = 500  # Chroma から一度に削除・取得する件数
+
+
+def build_index(version):  # インデックス構築
+    """
+    ベクトルDB構築（1コレクション。各チャンクは bucket メタデータで仕分け）
+    台帳（manifest）と比較し、追加・変更されたソースだけを読み込み・埋め込みする
+    """
+    logger = logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー取得（セッション外の構築でも出力）
+
+    embeddings = CachedEmbeddings(  # 未変更チャンクは再埋め込みしない
+        clients.get_embeddings(),  # 共有埋め込みクライアント
+        model_name=cf.EMBEDDING_MODEL_NAME,
+        path=cf.EMBED_CACHE_PATH,
+        max_entries=cf.EMBED_CACHE_MAX_ENTRIES,
+        max_age_days=cf.EMBED_CACHE_MAX_AGE_DAYS,
+        batch_size=cf.EMBED_BATCH_SIZE,
+    )
+
+    settings = ingest_settings()  # 取り込み設定（変わったら全再構築）
+    manifest = im.load_manifest(cf.MANIFEST_PATH, settings)  # 台帳読み込み
+    db = _open_collection(embeddings)  # 既存コレクションを開く
+    if not manifest["sources"] or db._collection.count() == 0:  # 台帳なし（版・設定違い含む） or DB消失
+        if logger:  # ログ出力
+            logger.info("Manifest not usable. Rebuilding collections from scratch.")
+        manifest = im.empty_manifest(settings)  # 台帳リセット
+        db = _open_collection(embeddings, reset=True)  # 重複を含む旧データを破棄
+
+    # 差分判定
+    paths = list_source_files()  # 対象ファイル一覧
+    changed, unchanged, removed, fingerprints = im.diff_sources(paths, manifest)
+    if logger:  # ログ出力
+        logger.info(
+            f"Manifest diff: changed={len(changed)} unchanged={len(unchanged)} removed={len(removed)}")
+
+    # 変更・削除されたソースの古いチャンクを削除
+    stale_ids = []
+    for path in changed + removed:
+        stale_ids.extend(manifest["sources"].get(path, {}).get("chunk_ids", []))
+        manifest["sources"].pop(path, None)
+    _delete_chunks(db, stale_ids)
+
+    # 追加・変更されたソースだけ読み込み（解析はプロセスプール、分割はこのスレッドで並行）
+    loaded = set()  # 解析できたソース（チャンクが0件でも台帳に載せる）
+    docs_new = load_data_sources(changed, loaded)
+    web_docs = []  # Webドキュメント
+    if getattr(cf, "USE_WEB_SOURCES", False):  # Web取り込み（robots.txt 準拠、許可URLのみ）
+        web_docs = load_web_sources_safe(getattr(cf, "WEB_URLS", []))  # Webドキュメント取得
+        web_docs = _diff_web_docs(web_docs, manifest, db, fingerprints)
+    else:
+        _drop_web_sources(manifest, db, keep=set())  # Web取り込み停止時は削除
+
+    chunker = RecordChunker(  # ラベル付きレコード分割（なければ通常分割）
+        chunk_size=cf.CHUNK_SIZE, chunk_overlap=cf.CHUNK_OVERLAP, separator=cf.CHUNK_SEPARATOR
+    )
+
+    # load → normalize → chunk → count → embed を遅延ジェネレータで流す
+    # （処理途中で持つのは解析済みファイルのドキュメント（逐次なら1ファイル分、プール使用時は
+    # LOADER_QUEUE_SIZE ファイル分まで）と埋め込みバッチ1つ分。
+    # 分割後のチャンクは検索用インデックスが参照するため、全件を1部ずつ保持する）
+    stats = ing.IngestStats(logger, log_every=cf.INGEST_PROGRESS_EVERY)  # 段階ごとの件数
+    ids_by_source = {}  # ソース → チャンクID
+    pipeline = ing.normalize(itertools.chain(docs_new, web_docs), adjust_string, stats)
+    pipeline = ing.chunk(pipeline, chunker.split_document, stats)
+    pipeline = ing.assign_ids(pipeline, _bucket_for, ids_by_source)
+    pipeline = ing.count_tokens(pipeline, CONTEXT_BUILDER.count)  # 文脈組み立て用のトークン数
+    splitted = {name: [] for name in BUCKETS}  # Fallback用の仕分け（同じチャンクを参照で共有）
+    for batch in ing.embed(ing.batched(pipeline, cf.EMBED_BATCH_SIZE), db, stats):
+        _add_to_buckets(splitted, batch)  # 追加済みバッチはその場で仕分け
+    n_new = len(splitted["all"])  # 新たに埋め込んだチャンク数
+    if n_new:  # 埋め込みキャッシュの上限超過分を削除（バッチごとではなく構築ごとに1回）
+        embeddings.evict()
+    if logger:  # ログ出力
+        logger.info(f"Ingest finished: {stats.summary()}")  # 段階ごとの件数
+
+    for src in loaded:  # 空ファイル・画像のみの PDF なども記録し、起動のたびに再解析しない
+        ids_by_source.setdefault(src, [])  # （読み込み失敗は記録せず、次回に再試行）
+    for src, ids in ids_by_source.items():  # 台帳更新
+        entry = dict(fingerprints.get(src, {}))
+        entry["chunk_ids"] = ids
+        manifest["sources"][src] = entry
+
+    # 未変更ソースのチャンクは再解析せず、永続化済みの DB から読み戻す
+    for path in unchanged:
+        manifest["sources"][path].update(
+            {k: v for k, v in fingerprints[path].items() if v is not None})
+    kept_ids = [cid for src, entry in manifest["sources"].items()
+                if src not in ids_by_source for cid in entry.get("chunk_ids", [])]
+    _add_to_buckets(splitted, _get_chunks(db, kept_ids))
+
+    im.save_manifest(cf.MANIFEST_PATH, manifest)  # 台帳保存
+
+    if logger:  # ログ出力
+        logger.debug(
+            "分割後ドキュメント件数: %s",
+            ", ".join([f"{k}={len(v)}" for k, v in splitted.items()])  # ログ出力
+        )
+        logger.info(
+            f"Embedded new chunks: {n_new} (stale removed: {len(stale_ids)})")
+
+    raw_docs_by_bucket = splitted  # Fallback用：分割後の生ドキュメントを保持
+    entity_index = EntityIndex(  # 名前 → チャンク
+        splitted["all"], cf.ENTITY_FIELDS, fillers=cf.ENTITY_QUERY_FILLERS)
+    chunks_by_id = {c.metadata.get("chunk_id"): c for c in splitted["all"]}  # キャッシュ復元用
+    keyword_index = KeywordIndex(  # キーワードFallback用（正規化本文の bi-gram）
+        splitted["all"], cf.KEYWORD_SYNONYMS, query_weight=cf.KEYWORD_QUERY_WEIGHT)
+    bm25 = BM25Index(splitted["all"], k1=cf.BM25_K1, b=cf.BM25_B)  # ローカル全文検索
+    retrievers, hybrids = build_retrievers(db, bm25)  # mode ごとの retriever（検索プロファイル）
+    retrieval = rt.TieredRetrieval(  # エンティティ → 厳格 → 範囲拡大 → キーワード
+        retrievers, entity_index, keyword_index, top_k=cf.TOP_K, hybrids=hybrids, rrf_k=cf.RRF_K)
+
+    if logger:  # ログ出力
+        logger.info(
+            "Indexed docs: " +
+            ", ".join([f"{k}={len(splitted[k])}" for k in splitted.keys()])
+        )  # ログ出力
+        logger.info(f"Embedding cache: {embeddings.stats()}")  # ヒット/ミス件数
+        logger.info(f"Entity index: {len(entity_index)} names")  # エンティティ件数
+
+    return {
+        "version": version,  # 世代番号
+        "raw_docs_by_bucket": raw_docs_by_bucket,  # 分割後チャンク
+        "db": db,  # Chromaコレクション
+        "embeddings": embeddings,  # キャッシュ付き埋め込み
+        "retrievers": retrievers,  # modeごとの retriever
+        "entity_index": entity_index,  # エンティティ完全一致インデックス
+        "chunks_by_id": chunks_by_id,  # チャンクID → チャンク
+        "retrieval": retrieval,  # 段階的検索
+    }
+
+
+def ingest_settings() -> str:  # 取り込み設定のハッシュ（台帳に保存）
+    """チャンクの分割・メタデータ・ベクトルが変わる設定。どれかが変われば全ソースを取り込み直す"""
+    return im.settings_fingerprint({
+        "embedding_model": cf.EMBEDDING_MODEL_NAME,
+        "chunk_size": cf.CHUNK_SIZE,
+        "chunk_overlap": cf.CHUNK_OVERLAP,
+        "chunk_separator": cf.CHUNK_SEPARATOR,
+        "csv_metadata_columns": list(cf.CSV_METADATA_COLUMNS),
+        "folder_keys": [cf.FOLDER_KEY_FACULTY, cf.FOLDER_KEY_DEPARTMENT,
+                        cf.FOLDER_KEY_RESEARCH, cf.FOLDER_KEY_CAMPUS],
+    })
+
+
+def build_retrievers(db, bm25, profiles=None):  # mode ごとの retriever
+    """
+    検索プロファイル（省略時は config.RETRIEVAL_PROFILES）から
+    mode → ベクトル retriever と、hybrid 指定の mode → HybridRetriever を作る
+    """
+    retrievers, hybrids = {}, {}
+    for name in BUCKETS:
+        profile = rt.profile_for(name, profiles)
+        kwargs = rt.search_kwargs_for(profile)
+        if name != "all":  # bucket 完全一致フィルタでモード別に検索
+            kwargs["filter"] = {"bucket": name}
+        retrievers[name] = db.as_retriever(
+            search_type=profile["search_type"], search_kwargs=kwargs)
+        if profile["retriever"] == "hybrid":  # BM25 + ベクトル（RRF）
+            hybrids[name] = rt.HybridRetriever(
+                retrievers[name], bm25, bucket=None if name == "all" else name,
+                k=profile["k"], rrf_k=cf.RRF_K, vector_timeout=cf.HYBRID_VECTOR_TIMEOUT_SEC)
+    return retrievers, hybrids
+
+
+def _add_to_buckets(splitted, chunks):  # チャンクを all と bucket ごとのリストに仕分け
+    for chunk in chunks:
+        splitted["all"].append(chunk)  # all には常に投入
+        bucket = chunk.metadata.get("bucket")
+        if bucket in splitted and bucket != "all":
+            splitted[bucket].append(chunk)
+
+
+def _open_collection(embeddings, reset=False):  # Chromaコレクションを開く
+    """永続化済みのコレクションを開く。reset=True なら旧データ・旧構成を破棄して作り直す"""
+    def _open(name):
+        return Chroma(
+            collection_name=name,
+            embedding_function=embeddings,
+            persist_directory=cf.VECTORSTORE_DIR,
+        )
+
+    if reset:  # 旧データ（重複を含む）を破棄
+        for name in [cf.VECTOR_COLLECTION_NAME, *_LEGACY_COLLECTIONS]:
+            _open(name).delete_collection()
+    return _open(cf.VECTOR_COLLECTION_NAME)
+
+
+def _delete_chunks(db, ids):  # チャンク削除
+    """指定IDのチャンクを削除（存在しないIDは無視される）"""
+    for i in range(0, len(ids), _ADD_BATCH):
+        db.delete(ids=ids[i:i + _ADD_BATCH])
+
+
+def _get_chunks(db, ids):  # 永続化済みチャンクの読み戻し
+    """ID順に Document として返す（埋め込みは再計算しない）"""
+    chunks = []
+    for i in range(0, len(ids), _ADD_BATCH):
+        part = ids[i:i + _ADD_BATCH]
+        res = db.get(ids=part, include=["documents", "metadatas"])
+        by_id = {
+            cid: Document(page_content=text or "", metadata=meta or {})
+            for cid, text, meta in zip(res["ids"], res["documents"], res["metadatas"])
+        }
+        chunks.extend(by_id[cid] for cid in part if cid in by_id)
+    return chunks
+
+
+def _bucket_for(src):  # ソースパスから bucket を判定
+    """RAG_ROOT_PATH からの相対パスで判定（ルート自体のパスにフォルダ名が含まれても影響しない）"""
+    if not src.startswith(("http://", "https://")):  # Web ソースは URL のまま
+        src = os.path.relpath(src, cf.RAG_ROOT_PATH)
+    if cf.FOLDER_KEY_FACULTY and cf.FOLDER_KEY_FACULTY in src:  # faculty
+        return "faculty"
+    if cf.FOLDER_KEY_DEPARTMENT and cf.FOLDER_KEY_DEPARTMENT in src:  # department
+        return "department"
+    if cf.FOLDER_KEY_RESEARCH and cf.FOLDER_KEY_RESEARCH in src:  # research
+        return "research"
+    if cf.FOLDER_KEY_CAMPUS and cf.FOLDER_KEY_CAMPUS in src:  # campus
+        return "campus"
+    return BUCKET_OTHER  # all からのみ検索される
+
+
+def _diff_web_docs(web_docs, manifest, db, fingerprints):  # Webソースの差分判定
+    """内容ハッシュが変わったURLのドキュメントだけを返し、古いチャンクを削除する"""
+    by_url = {}
+    for doc in web_docs:  # URLごとにまとめる
+        by_url.setdefault(str(doc.metadata.get("source", "")), []).append(doc)
+
+    changed_docs = []
+    for url, docs in by_url.items():
+        digest = im.text_hash("\n".join(d.page_content for d in docs))
+        entry = manifest["sources"].get(url)
+        if entry and entry.get("hash") == digest:  # 未変更
+            continue
+        _delete_chunks(db, (entry or {}).get("chunk_ids", []))
+        manifest["sources"].pop(url, None)
+        fingerprints[url] = {"hash": digest, "web": True}
+        changed_docs.extend(docs)
+
+    _drop_web_sources(manifest, db, keep=set(getattr(cf, "WEB_URLS", [])) | set(by_url))
+    return changed_docs
+
+
+def _drop_web_sources(manifest, db, keep):  # 設定から外れたWebソースを削除
+    for src in [s for s, e in manifest["sources"].items() if e.get("web") and s not in keep]:
+        _delete_chunks(db, manifest["sources"].pop(src).get("chunk_ids", []))
+
+
+def list_source_files():  # 対象ファイル一覧
+    """RAG_ROOT_PATH 配下の対応拡張子ファイルを列挙"""
+    logger = logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー取得（セッション外の構築でも出力）
+
+    def _on_skip(path):  # 非対応拡張子
+        if logger:  # ログ出力
+            logger.debug(
+                "Skipped (unsupported): %s (%s)", os.path.basename(path), os.path.splitext(path)[1])  # ログ出力
+
+    return lp.scan_source_files(cf.RAG_ROOT_PATH, on_skip=_on_skip)  # os.scandir で走査
+
+
+def load_data_sources(paths, loaded=None):  # データソース読み込み
+    """
+    指定ファイル（追加・変更分）をプロセスプールで解析し、入力順にドキュメントを返す
+    loaded: 指定すると解析に成功したパスを追加する（読み込み失敗のパスは入れない）
+    """
+    logger = logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー取得（セッション外の構築でも出力）
+    for path, docs, error in lp.iter_parsed(paths):  # 解析済みのものから順に受け取る
+        file_name = os.path.basename(path)  # ファイル名
+        if error:  # 読み込み失敗
+            if logger:  # ログ出力
+                logger.error(
+                    f"Load failed: {file_name} ({os.path.splitext(path)[1]}) -> {error}")  # ログ出力
+            continue
+        if loaded is not None:
+            loaded.add(path)
+        if logger:  # ログ出力
+            logger.debug("Loaded: %s (%d docs)", file_name, len(docs))  # ログ出力
+        yield from docs
+
+
+@lru_cache(maxsize=64)  # キャッシュ
+def _get_robots_parser(base_url):  # robots.txt パーサ取得
+    parts = urlparse.urlsplit(base_url)  # URL分解
+    # robots.txt URL
+    robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+    rp = robotparser.RobotFileParser()  # パーサ生成
+    rp.set_url(robots_url)  # URL設定
+    try:  # 読み込み
+        rp.read()  # 読み込み
+    except Exception:  # 読み込み失敗
+        pass  # 無視
+    return rp  # 返す
+
+
+def _can_fetch_url(url, user_agent):  # URLのクロール許可確認
+    try:  # 確認
+        parts = urlparse.urlsplit(url)  # URL分解
+        base = f"{parts.scheme}://{parts.netloc}"  # ベースURL
+        rp = _get_robots_parser(base)  # パーサ取得
+        return bool(rp.can_fetch(user_agent, url))  # クロール許可確認
+    except Exception:  # エラー時
+        return False  # 不可
+
+
+def load_web_sources_safe(urls):  # Webソース読み込み
+    logger = logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー取得（セッション外の構築でも出力）
+    docs = []  # ドキュメントリスト
+    if not urls:  # URLがなければ
+        return docs  # 空のリストを返す
+
+    ua = os.getenv("USER_AGENT") or cf.CRAWL_USER_AGENT  # User-Agent
+    headers = {"User-Agent": ua}  # ヘッダ
+
+    for url in urls:  # URL走査
+        if not _can_fetch_url(url, headers["User-Agent"]):  # クロール不可なら
+            if logger:  # ログ出力
+                logger.info(f"[robots] Skipped (disallowed): {url}")  # ログ出力
+            continue  # 次へ
+        try:  # 読み込み
+            loader = WebBaseLoader(
+                web_paths=[url],
+                requests_kwargs={"headers": headers, "timeout": 15},
+                continue_on_failure=True,
+                verify_ssl=True,
+            )
+            loaded = loader.load()
+            docs.extend(loaded)
+            if logger:  # ログ出力
+                logger.info(
+                    f"[web] Loaded {len(loaded)} docs from: {url}")  # ログ出力
+            time.sleep(1.0)  # 負荷配慮
+        except Exception as e:  # 読み込み失敗
+            if logger:  # ログ出力
+                logger.error(f"[web] Load failed: {url} -> {e}")  # ログ出力
+    return docs  # ドキュメントリストを返す
+
+
+def adjust_string(s):  # 文字列調整
+    """Windows環境での文字化け回避のための軽い正規化"""
+    if not isinstance(s, str):  # 文字列でなければ
+        return s  # そのまま返す
+    if sys.platform.startswith("win"):  # Windows環境なら
+        s = unicodedata.normalize('NFC', s)  # 正規化
+        s = s.encode("cp932", "ignore").decode("cp932")  # cp932でエンコード・デコード
+        return s  # 返す
+    return s  # そのまま返す
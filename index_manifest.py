@@ -0,0 +1,95 @@
+"""
+index_manifest.py
+取り込み済みソースの台帳（mtime / size / 内容ハッシュ / チャンクID）を管理する
+台帳には取り込み設定（埋め込みモデル・分割設定など）のハッシュも保存し、設定が変わったら全再構築する
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 5  # 台帳の形式・チャンクID・保存構成・分割方法・チャンクのメタデータを変えたら上げる（全再構築になる）
+
+
+def settings_fingerprint(settings: dict) -> str:  # 取り込み設定のハッシュ
+    """チャンクの分割・メタデータ・ベクトルを左右する設定（名前 → 値）から決まるハッシュ"""
+    raw = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def empty_manifest(settings: str | None = None) -> dict:  # 空の台帳
+    return {"version": MANIFEST_VERSION, "settings": settings, "sources": {}}
+
+
+def load_manifest(path: str, settings: str | None = None) -> dict:  # 台帳読み込み
+    """
+    台帳を読み込む。存在しない・壊れている・版が違う・取り込み設定（settings_fingerprint）が
+    違う場合は空の台帳を返す
+    """
+    if not os.path.exists(path):  # 初回
+        return empty_manifest(settings)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception:  # 壊れていたら作り直し
+        return empty_manifest(settings)
+    if manifest.get("version") != MANIFEST_VERSION:  # 版違いは作り直し
+        return empty_manifest(settings)
+    if manifest.get("settings") != settings:  # 埋め込みモデル・分割設定などが変わったら作り直し
+        return empty_manifest(settings)
+    manifest.setdefault("sources", {})
+    return manifest
+
+
+def save_manifest(path: str, manifest: dict):  # 台帳保存（一時ファイル→置換で原子的に）
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def content_hash(path: str) -> str:  # ファイル内容のハッシュ
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):  # 1MBずつ読む
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_hash(text: str) -> str:  # 文字列のハッシュ（Webソース用）
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(source: str, index: int, text: str) -> str:  # チャンクID
+    """ソース・通し番号・本文から決まる ID（同じ入力なら常に同じ ID）"""
+    raw = f"{source}\x00{index}\x00{text}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def diff_sources(paths: list[str], manifest: dict):  # 差分判定
+    """
+    ファイル一覧と台帳を比較して (changed, unchanged, removed, fingerprints) を返す
+    - mtime と size が同じなら内容は読まずに未変更とみなす
+    - どちらかが違えばハッシュを計算し、ハッシュが同じなら未変更（mtime だけ更新）
+    - fingerprints: 今回のパス → {"mtime", "size", "hash"}
+    """
+    sources = manifest.get("sources", {})
+    changed, unchanged, fingerprints = [], [], {}
+    for path in paths:
+        st_ = os.stat(path)
+        entry = sources.get(path)
+        if entry and entry.get("mtime") == st_.st_mtime and entry.get("size") == st_.st_size:
+            unchanged.append(path)  # 高速パス（ハッシュ計算なし）
+            fingerprints[path] = {"mtime": st_.st_mtime, "size": st_.st_size,
+                                  "hash": entry.get("hash")}
+            continue
+        digest = content_hash(path)
+        fingerprints[path] = {"mtime": st_.st_mtime, "size": st_.st_size, "hash": digest}
+        if entry and entry.get("hash") == digest:  # touch されただけ
+            unchanged.append(path)
+        else:
+            changed.append(path)
+
+    current = set(paths)
+    removed = [p for p in sources if p not in current and not sources[p].get("web")]
+    return changed, unchanged, removed, fingerprints
@@ -0,0 +1,89 @@
+"""
+ingest.py
+取り込み処理を load → normalize → chunk → count → embed の遅延ジェネレータで段階的に流す
+（段の間で受け渡し中に持つのはドキュメント1件・埋め込みバッチ1つ分だけ。
+埋め込み済みバッチを残すかどうかは呼び出し側が決める）
+"""
+import index_manifest as im
+
+STAGES = ("documents", "chunks", "batches", "embedded")  # 進捗を数える段階
+
+
+class IngestStats:
+    """段階ごとの処理件数（進捗ログ用）"""
+
+    def __init__(self, logger=None, log_every: int = 0):
+        self.counts = {name: 0 for name in STAGES}  # 段階ごとの件数
+        self.logger = logger  # 進捗ログ出力先
+        self.log_every = log_every  # 何バッチごとに進捗を出すか（0 なら出さない）
+
+    def add(self, stage: str, n: int = 1):  # 件数加算
+        self.counts[stage] += n
+        if (stage == "batches" and self.logger and self.log_every
+                and self.counts["batches"] % self.log_every == 0):
+            self.logger.info(f"Ingest progress: {self.summary()}")
+
+    def summary(self) -> str:  # 件数の文字列表現
+        return ", ".join(f"{k}={v}" for k, v in self.counts.items())
+
+
+def normalize(docs, adjust, stats: IngestStats):  # 正規化段
+    """本文を adjust で調整し、文字列メタデータの前後空白を除く"""
+    for doc in docs:
+        doc.page_content = adjust(doc.page_content)  # 文字列調整
+        for k in list(doc.metadata.keys()):  # メタデータの文字列正規化
+            v = doc.metadata[k]
+            doc.metadata[k] = v.strip() if isinstance(v, str) else v
+        stats.add("documents")
+        yield doc
+
+
+def chunk(docs, split_document, stats: IngestStats):  # 分割段
+    """ドキュメントを split_document でチャンクに分割して1件ずつ返す"""
+    for doc in docs:
+        for c in split_document(doc):
+            stats.add("chunks")
+            yield c
+
+
+def assign_ids(chunks, bucket_for, ids_by_source: dict):  # ID付与段
+    """
+    ソース内の通し番号から決定的なチャンクIDと bucket を付与する
+    ids_by_source: ソース → チャンクID一覧（台帳更新用に呼び出し側へ返す）
+    """
+    for c in chunks:
+        src = str((c.metadata or {}).get("source", ""))  # ソース取得
+        ids = ids_by_source.setdefault(src, [])
+        cid = im.chunk_id(src, len(ids), c.page_content)  # 決定的なID
+        c.metadata["chunk_id"] = cid
+        c.metadata["bucket"] = bucket_for(src)
+        ids.append(cid)
+        yield c
+
+
+def count_tokens(chunks, count):  # トークン数付与段
+    """チャンクのトークン数をメタデータ token_count に保存する（検索時の文脈組み立てで再計算しない）"""
+    for c in chunks:
+        c.metadata["token_count"] = count(c.page_content)
+        yield c
+
+
+def batched(items, size: int):  # バッチ化段
+    """size 件ずつのリストにまとめる"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed(batches, db, stats: IngestStats):  # 埋め込み段
+    """バッチごとにベクトルストアへ追加（埋め込み）し、追加済みバッチを返す"""
+    for batch in batches:
+        db.add_documents(batch, ids=[c.metadata["chunk_id"] for c in batch])
+        stats.add("embedded", len(batch))
+        stats.add("batches")
+        yield batch
@@ -0,0 +1,83 @@
+"""
+keyword_index.py
+キーワードFallback用の文字 bi-gram 転置インデックス
+（正規化済み本文をインデックス作成時に1回だけ計算し、質問ごとの全件走査をなくす）
+"""
+import unicodedata
+
+
+def normalize_text(s: str) -> str:  # 文字列の正規化（検索用）
+    # 例：全角→半角、英字小文字化、前後空白削除
+    return unicodedata.normalize("NFKC", s or "").lower().strip()
+
+
+def _grams(text: str) -> set:  # 1文字 + 2文字の部分文字列（日本語は分かち書きなしで照合できる）
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class KeywordIndex:
+    """
+    正規化本文の文字 bi-gram → チャンク番号 の転置インデックス
+    - 語の候補は bi-gram（1文字の語は文字）の共通集合で絞り込み、本文の部分一致で確定
+    - 質問全体の一致に加え、synonyms のキーが質問に含まれれば値の語でも照合する
+    - スコア = Σ 語の重み × 出現回数。スコア順（同点は取り込み順）に返す
+    """
+
+    def __init__(self, chunks, synonyms: dict | None = None, query_weight: float = 2.0):
+        self.chunks = list(chunks)  # チャンク（番号 = 取り込み順）
+        self.synonyms = {normalize_text(k): tuple(normalize_text(v) for v in vs)
+                         for k, vs in (synonyms or {}).items()}  # 正規化済み類義語表
+        self.query_weight = query_weight  # 質問全体の一致の重み
+        self._texts = []  # 正規化済み本文
+        self._postings = {}  # gram → チャンク番号の集合
+        self._by_bucket = {}  # bucket → チャンク番号の集合
+        for i, c in enumerate(self.chunks):
+            text = normalize_text(c.page_content)
+            self._texts.append(text)
+            for g in _grams(text):
+                self._postings.setdefault(g, set()).add(i)
+            bucket = (c.metadata or {}).get("bucket")
+            if bucket:
+                self._by_bucket.setdefault(bucket, set()).add(i)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _terms(self, query_norm: str):  # 照合する語と重み
+        terms = {}
+        if query_norm:
+            terms[query_norm] = self.query_weight
+        for key, words in self.synonyms.items():
+            if key in query_norm:
+                for w in words:
+                    terms.setdefault(w, 1.0)
+        return terms
+
+    def _candidates(self, term: str):  # 語を含みうるチャンク番号（bi-gram の共通集合）
+        grams = [term] if len(term) == 1 else [term[i:i + 2] for i in range(len(term) - 1)]
+        postings = sorted((self._postings.get(g, set()) for g in set(grams)), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for p in postings[1:]:
+            result &= p
+            if not result:
+                break
+        return result
+
+    def lookup(self, query_norm: str, bucket: str | None = None, limit: int = 15):
+        """
+        正規化済みの質問に一致するチャンクをスコア順に最大 limit 件返す
+        bucket 指定時はその bucket のチャンクのみ（該当チャンクがない bucket は全体）
+        """
+        allowed = self._by_bucket.get(bucket) if bucket else None  # None なら全体
+        scores = {}  # チャンク番号 → スコア
+        for term, weight in self._terms(query_norm).items():
+            for i in self._candidates(term):
+                if allowed is not None and i not in allowed:
+                    continue
+                n = self._texts[i].count(term)  # 部分一致で確定
+                if n:
+                    scores[i] = scores.get(i, 0.0) + weight * n
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))[:limit]
+        return [self.chunks[i] for i in ranked]
@@ -0,0 +1,134 @@
+"""
+loader_pipeline.py
+データフォルダの走査とファイル解析（PDF/DOCX/CSV/TXT）をプロセスプールで並列化する
+"""
+import multiprocessing
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import config as cf
+
+_DONE = object()  # 終端マーカー
+# ワーカーは spawn で起動（プールは生産側スレッドから作るため、fork だと他スレッドが持つロックを
+# 握ったままの状態を子プロセスが引き継いで固まることがある）
+_MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class _Failure:  # 生産側スレッドで起きた例外の受け渡し用
+    def __init__(self, error):
+        self.error = error
+
+
+def scan_source_files(root, on_skip=None):  # 対象ファイル列挙
+    """
+    os.scandir で root 配下を走査し、対応拡張子のファイルを名前順で返す
+    シンボリックリンクのフォルダもたどる（実体パスで訪問済みを記録し、リンクの循環は1回だけ）
+    on_skip: 非対応拡張子のファイルごとに呼ばれる（ログ出力用）
+    """
+    paths = []
+    visited = set()  # 走査済みフォルダの実体パス
+
+    def _walk(path):
+        real = os.path.realpath(path)
+        if real in visited:  # 循環・同じフォルダへの別リンク
+            return
+        visited.add(real)
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)  # 決定的な順序
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if entry.is_dir():  # リンク先のフォルダも含む
+                _walk(entry.path)  # 再帰
+            elif os.path.splitext(entry.name)[1] in cf.ALLOWED_EXTENSIONS:
+                paths.append(entry.path)
+            elif on_skip:
+                on_skip(entry.path)
+
+    _walk(root)
+    return paths
+
+
+def parse_file(path):  # 個別ファイル解析（ワーカープロセスで実行）
+    """(path, docs, error) を返す。例外は文字列にしてプロセス外へ持ち出す"""
+    ext = os.path.splitext(path)[1]  # 拡張子
+    try:
+        loader = cf.ALLOWED_EXTENSIONS[ext](path)  # ローダー生成
+        return path, loader.load(), None  # 読み込み
+    except Exception as e:  # 読み込み失敗
+        return path, [], f"{type(e).__name__}: {e}"
+
+
+def _parse_bytes(paths):  # 解析の重いファイル（PDF/DOCX）の合計サイズ
+    total = 0
+    for path in paths:
+        if os.path.splitext(path)[1] in cf.LOADER_PARALLEL_EXTENSIONS:
+            try:
+                total += os.path.getsize(path)
+            except OSError:  # 消えたファイルは解析時にエラーとして返す
+                pass
+    return total
+
+
+def iter_parsed(paths, workers=None, queue_size=None):  # 並列解析
+    """
+    paths を並列に解析し、入力と同じ順序で (path, docs, error) を順次返す
+    - 解析結果は上限付きキューで消費側（チャンク分割）へ渡すので、解析と分割が重なる
+    - workers が 1 以下、または PDF/DOCX の合計が LOADER_PARALLEL_MIN_BYTES 未満の場合は
+      同じスレッドで逐次解析する（プールの起動の方が解析より遅いため）
+    """
+    workers = cf.LOADER_WORKERS if workers is None else workers
+    queue_size = cf.LOADER_QUEUE_SIZE if queue_size is None else queue_size
+    if workers <= 1 or _parse_bytes(paths) < cf.LOADER_PARALLEL_MIN_BYTES:  # 逐次
+        for path in paths:
+            yield parse_file(path)
+        return
+
+    q = queue.Queue(maxsize=max(1, queue_size))  # 解析→分割の受け渡し
+    stop = threading.Event()  # 消費側が途中で終了した場合の停止通知
+
+    def _put(item):  # 停止されるまで待ちながら投入
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT) as ex:
+                pending = deque()  # 投入済み（入力順）
+                window = workers * 2  # 同時に走らせる件数の上限
+                for path in paths:
+                    pending.append(ex.submit(parse_file, path))
+                    if len(pending) >= window and not _put(pending.popleft().result()):
+                        break
+                while pending and not stop.is_set():
+                    if not _put(pending.popleft().result()):
+                        break
+                for f in pending:  # 途中終了時は未着手分を取り消す
+                    f.cancel()
+        except BaseException as e:  # プール自体の失敗は消費側へ
+            _put(_Failure(e))
+        finally:
+            _put(_DONE)
+
+    producer = threading.Thread(target=_produce, name="loader-pipeline", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        producer.join()
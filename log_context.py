@@ -0,0 +1,76 @@
+"""
+log_context.py
+ログ出力の設定（ハンドラはプロセスで1回だけ）と、ログレコードへのセッションID付与
+（contextvars で実行中のセッションを保持し、フィルタで各レコードに載せる）
+"""
+import contextvars
+import logging
+import os
+import sys
+import threading
+from logging.handlers import TimedRotatingFileHandler
+
+import config as cf
+import write_behind as wb
+
+SESSION_ID = contextvars.ContextVar("session_id", default="-")  # 実行中のセッションID
+
+
+def bind_session_id(session_id: str):  # 現在のスレッド（コンテキスト）のセッションIDを設定
+    SESSION_ID.set(session_id or "-")
+
+
+class SessionIdFilter(logging.Filter):
+    """レコードに session_id 属性を付ける（フォーマットで %(session_id)s として使う）"""
+
+    def filter(self, record):
+        if not hasattr(record, "session_id"):
+            record.session_id = SESSION_ID.get()
+        return True
+
+
+_LOGGING_LOCK = threading.Lock()  # ハンドラ設定用ロック（プロセスで1回だけ）
+_LOGGING_CONFIGURED = False
+
+
+def configure_logging():  # ハンドラ設定（プロセスで1回だけ。セッションごとには作り直さない）
+    global _LOGGING_CONFIGURED
+    with _LOGGING_LOCK:
+        if _LOGGING_CONFIGURED:
+            return
+        logger = logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー取得
+        logger.setLevel(cf.LOG_LEVEL)  # ログレベル設定
+        logger.handlers.clear()  # 既存ハンドラ削除
+
+        os.makedirs(cf.LOG_DIR, exist_ok=True)  # ログフォルダ作成
+        log_file = os.path.join(cf.LOG_DIR, cf.LOG_FILE)  # ログファイルパス
+
+        handler = TimedRotatingFileHandler(
+            log_file, when="midnight", interval=1, backupCount=7, encoding="utf-8"
+        )  # 日次ローテート、7世代保存
+        handler.suffix = "%Y%m%d"  # ログファイル名のサフィックス設定
+
+        formatter = logging.Formatter(
+            "[%(levelname)s] %(asctime)s line %(lineno)s, in %(funcName)s, session_id=%(session_id)s: %(message)s"
+        )  # フォーマット設定（セッションIDはフィルタでレコードごとに付与）
+        handler.setFormatter(formatter)  # フォーマッタ設定
+
+        console_handler = logging.StreamHandler(sys.stdout)  # コンソール出力用ハンドラ
+        console_handler.setFormatter(formatter)  # フォーマッタ設定
+
+        # ファイル・コンソールへの出力は別スレッドで行い、画面描画側はキューに積むだけにする
+        queue_handler = wb.queue_logging([handler, console_handler])
+        queue_handler.addFilter(SessionIdFilter())  # 呼び出し元スレッドのセッションIDを付ける
+        logger.addHandler(queue_handler)
+
+        trace_logger = logging.getLogger(cf.TRACE_LOGGER_NAME)  # 質問ごとのトレース（JSON 1行）
+        trace_logger.setLevel(logging.INFO)
+        trace_logger.propagate = False  # アプリログには出さない
+        trace_logger.handlers.clear()
+        trace_handler = TimedRotatingFileHandler(
+            os.path.join(cf.LOG_DIR, cf.TRACE_LOG_FILE), when="midnight", interval=1,
+            backupCount=7, encoding="utf-8")
+        trace_handler.suffix = "%Y%m%d"
+        trace_handler.setFormatter(logging.Formatter("%(message)s"))
+        trace_logger.addHandler(wb.queue_logging([trace_handler]))
+        _LOGGING_CONFIGURED = True
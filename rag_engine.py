@@ -0,0 +1,348 @@
+"""
+rag_engine.py
+RAG の本体（検索 → 回答キャッシュ → 文脈組み立て → LLM）。Streamlit のセッションには依存しない
+インデックス（index_builder.build_index の戻り値）・キャッシュ・クライアントを保持し、
+画面（ui_components）やベンチマークからは answer / stream（非同期版は aanswer / astream）を呼ぶだけにする
+"""
+import asyncio
+import logging
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import clients
+import config as cf
+import tracing
+from answer_cache import ANSWER_CACHE
+from context_builder import CONTEXT_BUILDER
+from keyword_index import normalize_text
+from retrieval_cache import RETRIEVAL_CACHE, aembed_query_cached, embed_query_cached
+
+_MODE_LABELS = {"faculty": "学部", "department": "学科",
+                "research": "研究室", "campus": "大学生活"}  # 該当なし時の表示名
+
+
+class _QueryVector:  # 質問ベクトル（必要になった時点で1回だけ取得）
+    def __init__(self, embeddings, user_message: str, query_norm: str, logger):
+        self.embeddings = embeddings  # 埋め込みクライアント
+        self.user_message = user_message  # 元の質問
+        self.query_norm = query_norm  # キャッシュキー
+        self.logger = logger  # ロガー
+        self._vec = None  # 質問ベクトル
+        self._done = False  # 取得済みフラグ
+
+    def get(self):  # 質問ベクトル（取得できなければ None）
+        if not self._done:
+            self._done = True
+            if self.embeddings is not None:
+                try:  # 同じ質問ならキャッシュから
+                    with tracing.span("embed_query"):
+                        self._vec = embed_query_cached(
+                            self.embeddings, self.user_message, self.query_norm)
+                except Exception as e:  # エラー処理
+                    self.logger.error("Query embedding error: %s", e)  # エラーログ出力
+        return self._vec
+
+    async def aget(self, timeout: float | None = None):  # get の非同期版（timeout 秒で打ち切り）
+        if not self._done:
+            self._done = True
+            if self.embeddings is not None:
+                try:
+                    with tracing.span("embed_query"):
+                        self._vec = await asyncio.wait_for(aembed_query_cached(
+                            self.embeddings, self.user_message, self.query_norm), timeout)
+                except asyncio.TimeoutError:  # 遅い場合はベクトルなしで続行
+                    self.logger.warning("Query embedding timed out after %ss", timeout)
+                except Exception as e:  # エラー処理
+                    self.logger.error("Query embedding error: %s", e)  # エラーログ出力
+        return self._vec
+
+
+class RagEngine:
+    """
+    1世代分のインデックスを持つ RAG エンジン（読み取り専用。全セッション・スレッドで共有できる）
+    会話履歴は呼び出し側が持ち、history（リスト）を渡したときだけ質問と回答を追加する
+    """
+
+    def __init__(self, index: dict, llm=None, retrieval_cache=RETRIEVAL_CACHE,
+                 answer_cache=ANSWER_CACHE, context_builder=CONTEXT_BUILDER, logger=None):
+        self.index = index  # index_builder.build_index の戻り値
+        self.version = index["version"]  # インデックス世代
+        self.retrieval = index["retrieval"]  # 段階的検索
+        self.embeddings = index["embeddings"]  # 質問の埋め込み用
+        self.chunks_by_id = index["chunks_by_id"]  # チャンクID → チャンク
+        self._llm = llm  # None なら共有 LLM クライアント
+        self.retrieval_cache = retrieval_cache  # 検索結果キャッシュ
+        self.answer_cache = answer_cache  # 回答キャッシュ
+        self.context_builder = context_builder  # 文脈組み立て
+        self.logger = logger or logging.getLogger(cf.APP_LOGGER_NAME)  # ロガー
+
+    @property
+    def llm(self):  # LLM クライアント
+        return self._llm if self._llm is not None else clients.get_llm()
+
+    # ===== 検索 =====
+
+    def retrieve(self, query: str, mode: str | None = None) -> list:  # 関連チャンク
+        query_norm = normalize_text(query)
+        related_docs, _ = self._cached_retrieve(
+            query, query_norm, mode, _QueryVector(self.embeddings, query, query_norm, self.logger))
+        return related_docs
+
+    def _cached_retrieve(self, user_message: str, query_norm: str, mode: str | None,
+                         query_vector: _QueryVector):  # キャッシュ付き検索
+        """
+        同じ質問（正規化後）・mode・k の検索結果をチャンクIDで再利用する
+        (関連チャンク, 回答した段) を返す
+        """
+        key, related_docs, tier, t0 = self._cache_lookup(query_norm, mode)
+        if related_docs is None:  # ミス
+            result = self.retrieval.retrieve(user_message, query_norm, mode, query_vector, self.logger)
+            related_docs, tier = self._cache_store(key, mode, result, t0), result.tier
+        return related_docs, tier
+
+    async def _acached_retrieve(self, user_message: str, query_norm: str, mode: str | None,
+                                query_vector: _QueryVector):  # _cached_retrieve の非同期版
+        key, related_docs, tier, t0 = self._cache_lookup(query_norm, mode)
+        if related_docs is None:  # ミス
+            result = await self.retrieval.aretrieve(
+                user_message, query_norm, mode, query_vector, self.logger,
+                timeout=cf.RETRIEVAL_CALL_TIMEOUT_SEC)
+            related_docs, tier = self._cache_store(key, mode, result, t0), result.tier
+        return related_docs, tier
+
+    def _cache_lookup(self, query_norm: str, mode: str | None):  # 検索結果キャッシュの照合
+        """(キー, ヒット時のチャンク（ミスなら None）, 回答した段, 開始時刻) を返す"""
+        cache = self.retrieval_cache
+        key = cache.make_key(query_norm, mode, cf.TOP_K)  # キャッシュキー
+        t0 = time.perf_counter()
+        ids, tier = cache.get(key, self.version) or (None, None)
+        if ids is None or not all(i in self.chunks_by_id for i in ids):
+            return key, None, None, t0
+        cache.record_hit(time.perf_counter() - t0)
+        tracing.annotate(retrieval_cache_hit=True, tier=tier, hits=len(ids))
+        self.logger.debug("[RAG] retrieval cache hit: mode=%s tier=%s hits=%d",
+                          mode, tier, len(ids))  # デバッグログ出力
+        self._log_cache_stats()
+        return key, [self.chunks_by_id[i] for i in ids], tier, t0
+
+    def _cache_store(self, key, mode: str | None, result, t0: float) -> list:  # 検索結果の保存
+        cache, related_docs = self.retrieval_cache, result.docs
+        tracing.annotate(retrieval_cache_hit=False, tier=result.tier, hits=len(related_docs))
+        if result.degraded:
+            tracing.annotate(retrieval_degraded=True)
+        self.logger.debug(
+            "[RAG] tier=%s mode=%s seconds=%.3f degraded=%s",
+            result.tier, mode, result.seconds, result.degraded)  # どの段で見つかったか
+        cache.record_miss(time.perf_counter() - t0)
+        ids = [(d.metadata or {}).get("chunk_id") for d in related_docs]
+        # 0件（検索エラー含む）・ID のないチャンク・ベクトル検索が欠けた結果（打ち切り・エラー）は保存しない
+        if ids and all(ids) and not result.degraded:
+            cache.put(key, ids, self.version, tier=result.tier)
+        self._log_cache_stats()
+        return related_docs
+
+    def _log_cache_stats(self):  # 定期的に集計を出力
+        cache = self.retrieval_cache
+        if cache.lookups() % cf.RETRIEVAL_CACHE_LOG_EVERY == 0:
+            self.logger.info("Retrieval cache: %s", cache.stats())  # ヒット率・省けた時間
+            self.logger.info("Retrieval tiers: %s", self.retrieval.stats())  # 段ごとの件数・平均時間
+
+    # ===== 回答 =====
+
+    def _prepare(self, user_message: str, mode: str | None, history):  # 検索〜プロンプト作成
+        """
+        RAG: ⓪エンティティ完全一致 → ①厳格 → ②範囲拡大 → ③キーワードFallback（全モード対応、retrieval.py）
+        LLM を呼ばずに回答できる場合（該当なし・回答キャッシュ）は {"answer": ...} を返し、
+        それ以外は LLM に渡すプロンプトと回答キャッシュ保存用の情報を返す
+        """
+        with tracing.span("normalize"):
+            query_norm = normalize_text(user_message)  # 検索用に正規化
+        query_vector = _QueryVector(  # 質問ベクトル（遅延取得）
+            self.embeddings, user_message, query_norm, self.logger)
+        with tracing.span("retrieval"):
+            related_docs, tier = self._cached_retrieve(
+                user_message, query_norm, mode, query_vector)  # 関連チャンク取得
+        return self._build_prompt(user_message, mode, history, related_docs, tier, query_vector)
+
+    async def _aprepare(self, user_message: str, mode: str | None, history):  # _prepare の非同期版
+        with tracing.span("normalize"):
+            query_norm = normalize_text(user_message)
+        query_vector = _QueryVector(self.embeddings, user_message, query_norm, self.logger)
+        with tracing.span("retrieval"):
+            related_docs, tier = await self._acached_retrieve(
+                user_message, query_norm, mode, query_vector)
+        if related_docs and tier != "entity":  # 回答キャッシュ照合用（ループを止めないよう先に非同期で取得）
+            await query_vector.aget(cf.QUERY_EMBED_TIMEOUT_SEC)
+        return self._build_prompt(user_message, mode, history, related_docs, tier, query_vector)
+
+    def _build_prompt(self, user_message: str, mode: str | None, history, related_docs,
+                      tier: str | None, query_vector: _QueryVector):  # 回答キャッシュ照合〜プロンプト作成
+        """
+        エンティティ段で回答した質問（名前だけの質問）は回答キャッシュを使わない
+        （照合に質問の埋め込みが要り、エンティティ段で省いた埋め込み API 呼び出しが戻るため）
+        """
+        logger = self.logger
+        top_src = (related_docs[0].metadata.get(
+            "source") if related_docs else "")  # 最初のドキュメントのソース
+        logger.debug(
+            "[RAG] mode=%s hits=%d top_source=%s", mode, len(related_docs), top_src)  # デバッグログ出力
+
+        if not related_docs:
+            label = _MODE_LABELS.get(mode, "データ")
+            return {"answer": f"該当する{label}の情報が見つかりませんでした。検索語やデータ投入をご確認ください。"}
+
+        chunk_ids = [(d.metadata or {}).get("chunk_id") for d in related_docs]  # 参照チャンクID
+        use_cache = all(chunk_ids) and tier != "entity"
+        vec = query_vector.get() if use_cache else None  # 回答キャッシュ照合用
+        if vec is not None:  # 言い回し違いの同じ質問なら保存済みの回答を返す
+            with tracing.span("answer_cache"):
+                cached = self.answer_cache.lookup(vec, mode, chunk_ids, self.version)
+            tracing.annotate(answer_cache_hit=cached is not None)
+            if cached is not None:
+                _remember(history, user_message, AIMessage(content=cached))  # 履歴に追加
+                logger.debug("[RAG] answer cache hit: %s", self.answer_cache.stats())  # デバッグログ出力
+                return {"answer": cached}
+
+        builder = self.context_builder
+        with tracing.span("context"):
+            context, used_docs, tokens = builder.build(related_docs)  # 予算内に上位から詰める
+        tracing.annotate(context_tokens=tokens, context_chunks=len(used_docs))
+        logger.debug(
+            "[RAG] context tokens=%d/%d chunks=%d/%d encoding=%s",
+            tokens, builder.budget, len(used_docs), len(related_docs), builder.encoding_name)
+        prompt = f"""
+あなたは教育機関向けの学内情報アシスタントです。
+以下の文脈に基づき、関連する情報を整理・統合して、要点を簡潔にわかりやすくまとめてください。
+文脈外の推測はしないでください。
+
+【文脈】
+{context}
+
+【質問】
+{user_message}
+
+【回答】（箇条書きと短い要約を含めてください）
+"""
+        return {"prompt": prompt, "vec": vec, "chunk_ids": chunk_ids}
+
+    def _finish(self, mode: str | None, prepared: dict, answer: str):
+        """生成した回答を回答キャッシュに保存"""
+        self.logger.debug("LLM回答: %s", answer)  # デバッグログ出力
+        if prepared["vec"] is not None and answer:  # 回答キャッシュへ保存
+            self.answer_cache.put(
+                prepared["vec"], mode, prepared["chunk_ids"], answer, self.version)
+
+    def answer(self, query: str, mode: str | None = None, history=None) -> dict:  # 回答生成
+        """
+        RAG で回答を生成して {"answer": ...} を返す（検索結果・回答はプロセス共有キャッシュで再利用）
+        LLM の失敗時は {"answer": ""}
+        """
+        prepared = self._prepare(query, mode, history)  # 検索〜プロンプト作成
+        if "answer" in prepared:  # LLM 不要
+            return {"answer": prepared["answer"]}
+
+        try:  # LLMへ投げる
+            with tracing.span("llm"):
+                response = self.llm.invoke(prepared["prompt"])  # LLM呼び出し
+            return self._on_response(query, mode, history, prepared, response)
+        except Exception as e:  # エラー処理
+            self.logger.error("LLM単体回答エラー: %s", e)  # エラーログ出力
+            return {"answer": ""}  # 空応答を返す
+
+    async def aanswer(self, query: str, mode: str | None = None, history=None) -> dict:  # answer の非同期版
+        """
+        検索は answer と同じ段・retriever を別スレッドで行い（1回ごとに RETRIEVAL_CALL_TIMEOUT_SEC で打ち切り）、
+        質問の埋め込みは aembed_query、LLM は ainvoke
+        """
+        prepared = await self._aprepare(query, mode, history)
+        if "answer" in prepared:
+            return {"answer": prepared["answer"]}
+        try:
+            with tracing.span("llm"):
+                response = await self.llm.ainvoke(prepared["prompt"])
+            return self._on_response(query, mode, history, prepared, response)
+        except Exception as e:
+            self.logger.error("LLM単体回答エラー: %s", e)
+            return {"answer": ""}
+
+    def _on_response(self, query, mode, history, prepared: dict, response) -> dict:  # LLM 応答の後処理
+        _annotate_usage(getattr(response, "usage_metadata", None))  # トークン数
+        _remember(history, query, response)  # 履歴に追加
+        answer = getattr(response, "content", str(response))  # 応答内容取得
+        self._finish(mode, prepared, answer)  # 回答キャッシュへ保存
+        return {"answer": answer}  # 応答を返す
+
+    def stream(self, query: str, mode: str | None = None, history=None):  # 回答のストリーミング
+        """
+        answer のストリーミング版。生成されたトークンを順に yield する
+        （LLM 不要の場合は回答全体を1回で yield。LLM が途中で失敗したらそこで終了）
+        """
+        prepared = self._prepare(query, mode, history)  # 検索〜プロンプト作成
+        if "answer" in prepared:  # LLM 不要
+            yield prepared["answer"]
+            return
+
+        parts = []  # 受信済みトークン
+        t0 = time.perf_counter()
+        try:  # LLMへ投げる
+            for chunk in self.llm.stream(prepared["prompt"]):  # トークン受信ごとに返す
+                text = _on_chunk(chunk, parts, t0)
+                if text:
+                    yield text
+        except Exception as e:  # エラー処理
+            self.logger.error("LLM単体回答エラー: %s", e)  # エラーログ出力
+            tracing.annotate(error=type(e).__name__)
+            return  # 途中までの回答で終了（キャッシュには保存しない）
+        finally:
+            tracing.record("llm", (time.perf_counter() - t0) * 1000)  # 画面描画の待ちも含む
+
+        answer = "".join(parts)  # 回答全体
+        _remember(history, query, AIMessage(content=answer))  # 履歴に追加
+        self._finish(mode, prepared, answer)  # 回答キャッシュへ保存
+
+    async def astream(self, query: str, mode: str | None = None, history=None):  # stream の非同期版
+        prepared = await self._aprepare(query, mode, history)
+        if "answer" in prepared:
+            yield prepared["answer"]
+            return
+
+        parts = []
+        t0 = time.perf_counter()
+        try:
+            async for chunk in self.llm.astream(prepared["prompt"]):
+                text = _on_chunk(chunk, parts, t0)
+                if text:
+                    yield text
+        except Exception as e:
+            self.logger.error("LLM単体回答エラー: %s", e)
+            tracing.annotate(error=type(e).__name__)
+            return
+        finally:
+            tracing.record("llm", (time.perf_counter() - t0) * 1000)
+
+        answer = "".join(parts)
+        _remember(history, query, AIMessage(content=answer))
+        self._finish(mode, prepared, answer)
+
+
+def _on_chunk(chunk, parts: list, t0: float) -> str:  # ストリーミングの1チャンク → 表示するテキスト
+    _annotate_usage(getattr(chunk, "usage_metadata", None))  # 最後のチャンクにトークン数
+    text = getattr(chunk, "content", "") or ""
+    if text:
+        if not parts:  # 最初のトークンまでの時間
+            tracing.record("llm.first_token", (time.perf_counter() - t0) * 1000)
+        parts.append(text)
+    return text
+
+
+def _annotate_usage(usage):  # LLM のトークン数をトレースに記録
+    if usage:
+        tracing.annotate(prompt_tokens=usage.get("input_tokens"),
+                         completion_tokens=usage.get("output_tokens"))
+
+
+def _remember(history, user_message: str, response):  # 会話履歴（LangChain メッセージ）に追加
+    if history is not None:
+        history.append(HumanMessage(content=user_message))  # ユーザーメッセージ
+        history.append(response)  # LLM応答
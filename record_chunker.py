@@ -0,0 +1,87 @@
+"""
+record_chunker.py
+「学部名: 」「学科名: 」などのラベルで始まるレコード単位の分割（1回の線形走査）
+ラベルがないドキュメントは CharacterTextSplitter で通常分割する（CSV 行はそのまま1チャンク）
+"""
+import re
+
+from langchain_text_splitters import CharacterTextSplitter
+
+from csv_ingest import RECORD_TYPE_CSV_ROW
+
+RECORD_LABELS = ("学部名", "学科名", "施設名", "イベント名", "証明書名")  # 分割ラベル
+_LABEL = "(?:" + "|".join(RECORD_LABELS) + ")[:：]"
+_FIRST_LABEL_RE = re.compile(_LABEL)  # 最初のレコード開始（行頭でなくてもよい）
+_BOUNDARY_RE = re.compile(r"\n(?=" + _LABEL + ")")  # 2件目以降のレコード境界（行頭のラベル）
+
+
+def split_records(text: str, chunk_size: int | None = None) -> list[str]:  # レコード分割
+    """
+    ラベルで始まるレコードに分割する。ラベルがなければ空リスト
+    - 最初のラベルより前の文字列は捨てる（従来の正規表現分割と同じ）
+    - chunk_size を超えるレコードは行単位で詰め直し、続きの先頭にも見出し行を付ける
+    """
+    first = _FIRST_LABEL_RE.search(text)
+    if first is None:
+        return []
+
+    records = []
+    start = first.start()
+    for m in _BOUNDARY_RE.finditer(text, start):  # 境界を1回走査で列挙
+        _append_record(records, text[start:m.start()], chunk_size)
+        start = m.end()  # 改行の直後（次のラベル位置）
+    _append_record(records, text[start:], chunk_size)
+    return records
+
+
+def _append_record(records: list[str], record: str, chunk_size: int | None):
+    record = record.rstrip()
+    if not record:
+        return
+    if not chunk_size or len(record) <= chunk_size:
+        records.append(record)
+        return
+    records.extend(_split_oversized(record, chunk_size))
+
+
+def _split_oversized(record: str, chunk_size: int) -> list[str]:  # 大きすぎるレコードの分割
+    """行単位で chunk_size 以内に詰める。続きのチャンクには見出し行（1行目）を付ける"""
+    lines = record.split("\n")
+    header = lines[0] if len(lines[0]) < chunk_size // 2 else ""  # 長すぎる見出しは付けない
+    limit = chunk_size - (len(header) + 1 if header else 0)  # 1行あたりの上限
+
+    units = []  # 上限以内に切った行
+    for line in lines:
+        units.extend([line[i:i + limit] for i in range(0, len(line), limit)] or [""])
+    pieces, current = [], ""
+    for unit in units:
+        candidate = f"{current}\n{unit}" if current else unit
+        if len(candidate) <= chunk_size:
+            current = candidate
+            continue
+        pieces.append(current)
+        current = f"{header}\n{unit}" if header else unit
+    pieces.append(current)
+    return [p for p in pieces if p.strip()]
+
+
+class RecordChunker:
+    """レコード分割 + 通常分割のチャンカー（パターンはモジュール読み込み時に1回だけコンパイル）"""
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, separator: str):
+        self.chunk_size = chunk_size  # レコード・通常分割の上限文字数
+        self._splitter = CharacterTextSplitter(  # ラベルがない場合の通常分割
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, separator=separator
+        )
+
+    def split_document(self, doc):  # ドキュメント分割
+        if doc.metadata.get("record_type") == RECORD_TYPE_CSV_ROW:  # CSV 行はそのまま1チャンク
+            if len(doc.page_content) <= self.chunk_size:
+                return [doc]
+            return [doc.__class__(page_content=p, metadata=doc.metadata.copy())
+                    for p in _split_oversized(doc.page_content, self.chunk_size)]
+        records = split_records(doc.page_content, self.chunk_size)
+        if records:  # ラベルがあればレコード単位
+            return [doc.__class__(page_content=r, metadata=doc.metadata.copy())
+                    for r in records]
+        return self._splitter.split_documents([doc])  # なければ通常分割
@@ -0,0 +1,285 @@
+"""
+retrieval.py
+段階的な検索戦略（エンティティ完全一致 → 厳格 → 範囲拡大 → キーワード）
+前段の候補を後段で使い回し、同じリモート呼び出し（埋め込み・ベクトル検索）を繰り返さない
+非同期版（aretrieve）は mode=None のときバケットごとの検索を並行に行い、1回ごとに時間で打ち切る
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import config as cf
+import tracing
+
+TIERS = ("entity", "strict", "widened", "keyword")  # 検索段（この順に試す）
+
+def profile_for(mode: str, profiles: dict | None = None) -> dict:  # mode の検索プロファイル
+    """profiles（省略時は config.RETRIEVAL_PROFILES）の "default" を mode の値で上書きした辞書"""
+    profiles = cf.RETRIEVAL_PROFILES if profiles is None else profiles
+    return {**profiles.get("default", {}), **profiles.get(mode, {})}
+
+
+def search_kwargs_for(profile: dict) -> dict:  # プロファイル → retriever の search_kwargs
+    kwargs = {"k": profile["k"]}
+    if profile["search_type"] == "mmr":
+        kwargs["fetch_k"] = max(profile["fetch_k"], profile["k"])
+        kwargs["lambda_mult"] = profile["lambda_mult"]
+    elif profile["search_type"] == "similarity_score_threshold":
+        kwargs["score_threshold"] = profile["score_threshold"]
+    return kwargs
+
+
+def vector_search(retriever, vec):  # 質問ベクトルで検索
+    """retriever の設定（search_type / search_kwargs）のまま、埋め込み済みベクトルで検索"""
+    store = retriever.vectorstore  # ベクトルストア
+    kwargs = dict(retriever.search_kwargs)  # k / fetch_k / filter など
+    if retriever.search_type == "mmr":
+        return store.max_marginal_relevance_search_by_vector(vec, **kwargs)
+    if retriever.search_type == "similarity_score_threshold":  # 関連度（0〜1）の下限で絞り込む
+        threshold = kwargs.pop("score_threshold", None)
+        relevance = store._select_relevance_score_fn()  # 距離 → 関連度（ストアの距離関数に対応）
+        pairs = store.similarity_search_by_vector_with_relevance_scores(vec, **kwargs)
+        return [doc for doc, dist in pairs if threshold is None or relevance(dist) >= threshold]
+    return store.similarity_search_by_vector(vec, **kwargs)
+
+
+def rrf_fuse(rankings, k: int, rrf_k: int = 60):  # Reciprocal Rank Fusion
+    """
+    複数のランキング（チャンクのリスト）を Σ 1 / (rrf_k + 順位) で統合し、上位 k 件を返す
+    同じチャンクは chunk_id（なければ本文）で同一視し、先に現れたものを使う
+    """
+    scores, first = {}, {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = (doc.metadata or {}).get("chunk_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            first.setdefault(key, doc)
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)  # 安定ソート（同点は出現順）
+    return [first[key] for key in ranked[:k]]
+
+
+_VECTOR_POOL = ThreadPoolExecutor(  # ハイブリッド検索のベクトル側（埋め込み + 検索）を実行
+    max_workers=cf.HYBRID_VECTOR_WORKERS, thread_name_prefix="vector-leg")
+
+
+class HybridRetriever:
+    """
+    BM25（ローカル）とベクトル検索を並行して行い、RRF で統合する
+    - ベクトル側（質問の埋め込みを含む）は vector_timeout 秒で打ち切り、BM25 の結果だけで返す
+      （埋め込み API が遅い・落ちている場合も BM25 側は回答できる）
+    - 打ち切ったベクトル側はバックグラウンドで完了し、質問ベクトルはキャッシュに残る
+    - search は (チャンク, ベクトル側も揃ったか) を返す（揃わなかった結果は検索結果キャッシュに保存しない）
+    """
+
+    def __init__(self, vector_retriever, bm25_index, bucket: str | None, k: int,
+                 rrf_k: int = 60, vector_timeout: float = 3.0):
+        self.vector_retriever = vector_retriever  # LangChain の retriever（bucket フィルタ込み）
+        self.bm25_index = bm25_index  # BM25 インデックス
+        self.bucket = bucket  # BM25 側の絞り込み（None なら全体）
+        self.k = k  # 返す件数
+        self.rrf_k = rrf_k  # RRF の順位補正
+        self.vector_timeout = vector_timeout  # ベクトル側の待ち時間上限（秒）
+
+    def _vector_leg(self, query_vector):  # ベクトル側（埋め込みに失敗したら None）
+        with tracing.span("retrieval.vector_leg"):
+            if self.vector_retriever is None:
+                return []
+            vec = query_vector.get()
+            if vec is None:
+                return None
+            return vector_search(self.vector_retriever, vec)
+
+    def search(self, query: str, query_vector, logger=None):  # 統合検索 → (チャンク, 完全か)
+        future = _VECTOR_POOL.submit(  # ログのセッションID・トレースを引き継ぐ
+            contextvars.copy_context().run, self._vector_leg, query_vector)
+        with tracing.span("retrieval.bm25"):
+            lexical = [doc for doc, _ in self.bm25_index.search(query, self.bucket, limit=self.k)]
+        try:
+            vector = future.result(timeout=self.vector_timeout)
+        except FutureTimeout:  # 遅い場合は BM25 のみ
+            vector = None
+            if logger:  # ログ出力
+                logger.warning("Vector leg timed out after %ss; BM25 only", self.vector_timeout)
+        except Exception as e:  # エラー処理（BM25 のみで続行）
+            vector = None
+            if logger:  # ログ出力
+                logger.error("Vector leg error: %s", e)  # エラーログ出力
+        if logger:  # ログ出力
+            logger.debug("[RAG] hybrid bm25=%d vector=%s", len(lexical),
+                         "-" if vector is None else len(vector))  # デバッグログ出力
+        return rrf_fuse([vector or [], lexical], self.k, self.rrf_k), vector is not None
+
+
+class RetrievalResult:
+    """検索結果と、どの段で見つかったか"""
+
+    def __init__(self, docs, tier, seconds, degraded=False):
+        self.docs = docs  # 関連チャンク（ランキング順）
+        self.tier = tier  # 回答した段（TIERS のいずれか。0件なら None）
+        self.seconds = seconds  # 所要時間
+        self.degraded = degraded  # 打ち切り・エラーで欠けた検索があったか（キャッシュしない）
+
+
+class TieredRetrieval:
+    """
+    mode ごとの検索を段階的に行う
+    - entity: 学部・学科・研究室名などの完全一致（埋め込み不要）。質問がほぼ名前だけならここで回答し、
+      それ以外は以降の段も行って名前のチャンクと RRF で統合する（名前のチャンクを同順位で先に置く）
+    - strict: mode の retriever（bucket メタデータで絞り込み。hybrid 指定の mode は BM25 + ベクトル）で検索
+    - widened: strict が0件なら 'all' で1回だけ検索（strict で検索済みなら繰り返さない）
+    - keyword: 文字 bi-gram 転置インデックスでのキーワード照合（スコア順）
+    段ごとの回答件数・所要時間を集計する（0件の質問の遅延測定用）
+    """
+
+    def __init__(self, retrievers: dict, entity_index, keyword_index, top_k: int,
+                 hybrids: dict | None = None, rrf_k: int = 60):
+        self.retrievers = retrievers  # mode → retriever
+        self.hybrids = hybrids or {}  # mode → HybridRetriever（hybrid 指定の mode のみ）
+        self.entity_index = entity_index  # 名前 → チャンク
+        self.keyword_index = keyword_index  # 文字 bi-gram → チャンク
+        self.top_k = top_k  # 最大件数
+        self.rrf_k = rrf_k  # 名前のチャンクとの統合（RRF）の順位補正
+        self._lock = threading.Lock()  # 集計値の保護
+        self.counts = {name: 0 for name in TIERS + ("none",)}  # 段ごとの回答件数
+        self.seconds = {name: 0.0 for name in TIERS + ("none",)}  # 段ごとの累計所要時間
+
+    def _name_for(self, mode):  # mode に応じた retriever 名（なければ 'all'）
+        return mode if mode in self.retrievers or mode in self.hybrids else "all"
+
+    def retrieve(self, query: str, query_norm: str, mode: str | None, query_vector,
+                 logger=None) -> RetrievalResult:
+        """
+        query_vector は .get() で質問ベクトル（失敗時 None）を返すオブジェクト
+        （埋め込みは最初に必要になった段で1回だけ行われる）
+        """
+        t0 = time.perf_counter()
+        searched = {}  # 検索済みの retriever → 欠けなく検索できたか（同じ検索を繰り返さない）
+        steps = self._tiers(query, query_norm, mode, logger)
+        try:
+            span, name = next(steps)
+            while True:  # 段の順序は _tiers に従う
+                with tracing.span(span):
+                    docs = self._search(name, query, query_vector, searched, logger)
+                span, name = steps.send(docs)
+        except StopIteration as stop:
+            return self._result(*stop.value, t0, searched)
+
+    async def aretrieve(self, query: str, query_norm: str, mode: str | None, query_vector,
+                        logger=None, timeout: float | None = None) -> RetrievalResult:
+        """
+        retrieve の非同期版（段の順序・検索する retriever は同じ。_tiers を共有）
+        - 質問の埋め込みは await query_vector.aget() で1回だけ行い、QUERY_EMBED_TIMEOUT_SEC 秒で打ち切る
+          （打ち切ったらベクトル検索なしで続行。ハイブリッドは BM25 のみ、エンティティ・キーワード段はそのまま）
+        - 検索は別スレッドで行い（イベントループを止めない）、1回ごとに timeout 秒で打ち切る
+        """
+        t0 = time.perf_counter()
+        searched = {}
+        steps = self._tiers(query, query_norm, mode, logger)
+        try:
+            span, name = next(steps)
+            await query_vector.aget(cf.QUERY_EMBED_TIMEOUT_SEC)  # 以降の検索（別スレッド）は取得済みのベクトルを使う
+            while True:
+                with tracing.span(span):
+                    docs = await self._asearch(name, query, query_vector, searched, logger, timeout)
+                span, name = steps.send(docs)
+        except StopIteration as stop:
+            return self._result(*stop.value, t0, searched)
+
+    def _tiers(self, query, query_norm, mode, logger):  # 段の順序（retrieve / aretrieve 共通）
+        """
+        検索する段を (span 名, retriever 名) で yield し、send で検索結果を受け取るジェネレータ
+        最後に (チャンク, 回答した段) を返す（StopIteration.value）
+        """
+        entity_docs, name_only = self._entity(query, mode, logger)  # ⓪ エンティティ完全一致
+        if name_only:  # 名前だけの質問はここで回答
+            return entity_docs, "entity"
+
+        docs = yield "retrieval.strict", self._name_for(mode)  # ① 厳格：mode の retriever（bucket で絞り込み）
+        tier = "strict"
+
+        if not docs and not entity_docs:  # ② 範囲拡大：'all'（未検索なら）
+            docs = yield "retrieval.widened", "all"
+            tier = "widened"
+
+        if not docs and not entity_docs:  # ③ キーワード Fallback（全モードで実施）
+            docs, tier = self._keyword(query_norm, mode)
+        return self._with_entity(entity_docs, docs, tier)
+
+    def _entity(self, query, mode, logger):  # エンティティ完全一致段 → (チャンク, 名前だけの質問か)
+        if self.entity_index is None:
+            return [], False
+        with tracing.span("retrieval.entity"):
+            docs = self.entity_index.lookup(query, mode, limit=self.top_k)
+            name_only = bool(docs) and self.entity_index.is_name_only(query)
+        if docs and logger and logger.isEnabledFor(logging.DEBUG):  # ログ出力（名前の照合は DEBUG 時のみ）
+            logger.debug("[RAG] entity hit: %s name_only=%s",
+                         self.entity_index.match_names(query), name_only)  # デバッグログ出力
+        return docs, name_only
+
+    def _with_entity(self, entity_docs, docs, tier):  # 名前のチャンクと後段の結果を統合
+        if not entity_docs or tier == "entity":
+            return docs, tier
+        if not docs:
+            return entity_docs, "entity"
+        return rrf_fuse([entity_docs, docs], self.top_k, self.rrf_k), tier
+
+    def _keyword(self, query_norm, mode):  # キーワード Fallback 段
+        if self.keyword_index is None:
+            return [], None
+        with tracing.span("retrieval.keyword"):
+            return self.keyword_index.lookup(query_norm, mode, limit=self.top_k), "keyword"
+
+    def _result(self, docs, tier, t0, searched: dict) -> RetrievalResult:  # 集計して結果を返す
+        tier = tier if docs else None
+        seconds = time.perf_counter() - t0
+        with self._lock:  # 集計
+            self.counts[tier or "none"] += 1
+            self.seconds[tier or "none"] += seconds
+        return RetrievalResult(docs, tier, seconds, degraded=not all(searched.values()))
+
+    async def _asearch(self, name, query, query_vector, searched: dict, logger, timeout):
+        """検索1回を別スレッドで実行し、timeout 秒で打ち切る（打ち切った検索は裏で完了する）"""
+        try:
+            return await asyncio.wait_for(asyncio.to_thread(
+                self._search, name, query, query_vector, searched, logger), timeout)
+        except asyncio.TimeoutError:  # 遅い検索は除いて続行
+            searched[name] = False
+            if logger:  # ログ出力
+                logger.warning("Retriever %s timed out after %ss", name, timeout)
+            return []
+
+    def _search(self, name, query, query_vector, searched: dict, logger):  # 検索（各 retriever 1回まで）
+        if name in searched:
+            return []
+        searched[name] = True
+        hybrid = self.hybrids.get(name)
+        if hybrid is not None:  # BM25 + ベクトル
+            docs, complete = hybrid.search(query, query_vector, logger)
+            if not complete:  # ベクトル側なし（BM25 のみ）
+                searched[name] = False
+            return docs
+        retriever = self.retrievers.get(name)
+        if retriever is None:
+            return []
+        vec = query_vector.get()
+        if vec is None:  # 埋め込みに失敗
+            searched[name] = False
+            return []
+        try:  # 検索実行
+            return vector_search(retriever, vec)
+        except Exception as e:  # エラー処理
+            searched[name] = False
+            if logger:  # ログ出力
+                logger.error("Retriever error: %s", e)  # エラーログ出力
+            return []
+
+    def stats(self) -> dict:  # 段ごとの回答件数と平均所要時間
+        with self._lock:
+            return {
+                name: {"count": n,
+                       "avg_ms": round(self.seconds[name] / n * 1000, 1) if n else 0.0}
+                for name, n in self.counts.items()
+            }
@@ -0,0 +1,135 @@
+"""
+retrieval_cache.py
+検索結果（チャンクID）と質問ベクトルのプロセス共有キャッシュ（LRU + TTL、インデックス再構築で自動破棄）
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import config as cf
+
+
+class TTLLRUCache:
+    """件数上限（LRU）と有効期限（TTL）付きのスレッドセーフな辞書"""
+
+    def __init__(self, maxsize: int, ttl: float | None):
+        self.maxsize = maxsize  # 件数上限
+        self.ttl = ttl  # 有効期限（秒）。None なら無期限
+        self._data = OrderedDict()  # key → (保存時刻, 値)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):  # 取得（期限切れは削除）
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            stored_at, value = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)  # 最近使ったものを末尾へ
+            return value
+
+    def put(self, key, value):  # 保存（上限超過分は古い順に削除）
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):  # 全削除
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class RetrievalCache:
+    """
+    (正規化クエリ, mode, k) → (チャンクID一覧, 回答した段) のキャッシュ
+    - インデックスの世代番号が変わったら全件破棄
+    - ヒット率と、ヒットで省けた推定時間（ミス時の平均検索時間との差）を集計
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None):
+        self._cache = TTLLRUCache(maxsize, ttl)
+        self._lock = threading.Lock()  # 世代番号・集計値の保護
+        self._version = None  # キャッシュ内容が対応するインデックス世代
+        self.hits = 0  # ヒット件数
+        self.misses = 0  # ミス件数
+        self.saved_seconds = 0.0  # ヒットで省けた推定時間
+        self._avg_miss_seconds = 0.0  # ミス時の平均検索時間（指数移動平均）
+
+    @staticmethod
+    def make_key(query_norm: str, mode: str | None, k: int):  # キャッシュキー
+        return (query_norm, mode or "all", k)
+
+    def _check_version(self, version):  # 世代が変わっていたら破棄
+        with self._lock:
+            if version != self._version:
+                self._cache.clear()
+                self._version = version
+
+    def get(self, key, version):  # (チャンクID一覧, 回答した段) を返す（なければ None）
+        self._check_version(version)
+        return self._cache.get(key)
+
+    def put(self, key, chunk_ids, version, tier=None):  # 保存
+        self._check_version(version)
+        self._cache.put(key, (list(chunk_ids), tier))
+
+    def clear(self):  # 全削除（インデックス破棄時）
+        self._cache.clear()
+
+    def record_hit(self, seconds: float):  # ヒット時の集計
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += max(0.0, self._avg_miss_seconds - seconds)
+
+    def record_miss(self, seconds: float):  # ミス時の集計
+        with self._lock:
+            self.misses += 1
+            if self.misses == 1:
+                self._avg_miss_seconds = seconds
+            else:
+                self._avg_miss_seconds = 0.8 * self._avg_miss_seconds + 0.2 * seconds
+
+    def lookups(self) -> int:  # 総検索回数
+        return self.hits + self.misses
+
+    def stats(self) -> dict:  # 集計値
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "saved_ms": round(self.saved_seconds * 1000, 1),
+                "avg_miss_ms": round(self._avg_miss_seconds * 1000, 1),
+                "entries": len(self._cache),
+            }
+
+
+RETRIEVAL_CACHE = RetrievalCache(  # プロセス共有インスタンス
+    maxsize=cf.RETRIEVAL_CACHE_MAX_ENTRIES, ttl=cf.RETRIEVAL_CACHE_TTL_SEC)
+QUERY_EMBEDDING_CACHE = TTLLRUCache(  # 正規化クエリ → 質問ベクトル
+    maxsize=cf.QUERY_EMBED_CACHE_MAX_ENTRIES, ttl=cf.QUERY_EMBED_CACHE_TTL_SEC)
+
+
+def embed_query_cached(embeddings, text: str, query_norm: str):  # キャッシュ付き質問埋め込み
+    """同じ質問（正規化後）の埋め込みは API を呼ばずに再利用する"""
+    vec = QUERY_EMBEDDING_CACHE.get(query_norm)
+    if vec is None:
+        vec = embeddings.embed_query(text)
+        QUERY_EMBEDDING_CACHE.put(query_norm, vec)
+    return vec
+
+
+async def aembed_query_cached(embeddings, text: str, query_norm: str):  # embed_query_cached の非同期版
+    vec = QUERY_EMBEDDING_CACHE.get(query_norm)
+    if vec is None:
+        vec = await embeddings.aembed_query(text)
+        QUERY_EMBEDDING_CACHE.put(query_norm, vec)
+    return vec
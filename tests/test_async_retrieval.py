@@ -0,0 +1,128 @@
+"""
+test_async_retrieval.py
+TieredRetrieval.aretrieve の質問埋め込みの打ち切りと、欠けた検索結果の判定（API キー・ネットワーク不要）
+"""
+import asyncio
+import logging
+import time
+
+from langchain_core.documents import Document
+
+import config as cf
+import retrieval as rt
+from bm25_index import BM25Index
+from keyword_index import KeywordIndex, normalize_text
+from rag_engine import _QueryVector
+
+LOGGER = logging.getLogger("test_async_retrieval")
+CHUNKS = [
+    Document(page_content="奨学金の申請は学生課で受け付けます。",
+             metadata={"chunk_id": "c1", "bucket": "campus", "source": "data/campus/a.txt"}),
+    Document(page_content="機械工学科ではロボットの研究を行っています。",
+             metadata={"chunk_id": "c2", "bucket": "department", "source": "data/department/b.txt"}),
+]
+
+
+class _SlowEmbeddings:  # 非同期の埋め込みが delay 秒かかる埋め込みクライアント
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+
+    def embed_query(self, text):
+        raise AssertionError("aretrieve は同期の埋め込みを呼ばない")
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return [1.0, 0.0]
+
+
+class _Store:  # 呼ばれたベクトルを記録するだけのベクトルストア
+    def __init__(self):
+        self.vectors = []
+
+    def similarity_search_by_vector(self, vec, **kwargs):
+        self.vectors.append(vec)
+        return [CHUNKS[1]]
+
+
+class _Retriever:  # LangChain の VectorStoreRetriever の代わり（vector_search が使う属性のみ）
+    search_type = "similarity"
+
+    def __init__(self, store):
+        self.vectorstore = store
+        self.search_kwargs = {"k": 2}
+
+
+def _retrieval(store):
+    retriever = _Retriever(store)
+    hybrid = rt.HybridRetriever(retriever, BM25Index(CHUNKS), None, k=2, vector_timeout=5.0)
+    return rt.TieredRetrieval({"all": retriever}, None, KeywordIndex(CHUNKS), top_k=2,
+                              hybrids={"all": hybrid})
+
+
+def _aretrieve(retrieval, embeddings, query):
+    query_norm = normalize_text(query) + f"#{time.monotonic_ns()}"  # 質問ベクトルキャッシュに当てない
+    query_vector = _QueryVector(embeddings, query, query_norm, LOGGER)
+    return asyncio.run(retrieval.aretrieve(query, query_norm, None, query_vector, LOGGER, timeout=5.0))
+
+
+def test_slow_query_embedding_is_cut_at_deadline(monkeypatch):
+    monkeypatch.setattr(cf, "QUERY_EMBED_TIMEOUT_SEC", 0.2)
+    store, embeddings = _Store(), _SlowEmbeddings(delay=10.0)
+    t0 = time.perf_counter()
+    result = _aretrieve(_retrieval(store), embeddings, "奨学金の申請")
+    elapsed = time.perf_counter() - t0
+
+    assert embeddings.calls == 1
+    assert elapsed < 1.0  # 埋め込みの 10 秒を待たない
+    assert store.vectors == []  # ベクトル検索はしない
+    assert result.tier == "strict"  # BM25 側で回答
+    assert [d.metadata["chunk_id"] for d in result.docs] == ["c1"]
+    assert result.degraded  # 検索結果キャッシュには保存しない
+
+
+def test_fast_query_embedding_is_used(monkeypatch):
+    monkeypatch.setattr(cf, "QUERY_EMBED_TIMEOUT_SEC", 2.0)
+    store, embeddings = _Store(), _SlowEmbeddings(delay=0.01)
+    result = _aretrieve(_retrieval(store), embeddings, "奨学金の申請")
+
+    assert store.vectors == [[1.0, 0.0]]
+    assert {d.metadata["chunk_id"] for d in result.docs} == {"c1", "c2"}
+    assert not result.degraded
+
+
+def test_vector_error_marks_result_degraded():
+    class _BrokenStore(_Store):
+        def similarity_search_by_vector(self, vec, **kwargs):
+            raise RuntimeError("vector store down")
+
+    query = "奨学金の申請"
+    query_norm = normalize_text(query)
+    embeddings = _SlowEmbeddings(delay=0.0)
+    embeddings.embed_query = lambda text: [1.0, 0.0]
+    result = _retrieval(_BrokenStore()).retrieve(
+        query, query_norm, None, _QueryVector(embeddings, query, query_norm, LOGGER), LOGGER)
+
+    assert [d.metadata["chunk_id"] for d in result.docs] == ["c1"]  # BM25 のみ
+    assert result.degraded
+
+
+def test_async_searches_same_retrievers_as_sync(monkeypatch):
+    monkeypatch.setattr(cf, "QUERY_EMBED_TIMEOUT_SEC", 2.0)
+    all_store, bucket_store = _Store(), _Store()
+    retrieval = _retrieval(all_store)
+    retrieval.retrievers["department"] = _Retriever(bucket_store)  # バケットの retriever もある状態
+    embeddings = _SlowEmbeddings(delay=0.0)
+    embeddings.embed_query = lambda text: [1.0, 0.0]
+
+    query = "ロボットの研究"
+    query_norm = normalize_text(query)
+    expected = retrieval.retrieve(
+        query, query_norm, None, _QueryVector(embeddings, query, query_norm, LOGGER), LOGGER)
+    result = _aretrieve(retrieval, embeddings, query)
+
+    assert len(all_store.vectors) == 2  # 同期・非同期とも 'all' を1回ずつ
+    assert bucket_store.vectors == []  # mode=None でバケットは検索しない
+    assert result.tier == expected.tier == "strict"
+    assert [d.metadata["chunk_id"] for d in result.docs] == [d.metadata["chunk_id"] for d in expected.docs]
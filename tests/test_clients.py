@@ -0,0 +1,68 @@
+"""
+test_clients.py
+共有 LLM / 埋め込みクライアントが同期・非同期とも共有 HTTP クライアント（接続プール）を使うこと
+（API キー・ネットワーク不要。非同期呼び出しは httpx.MockTransport で受ける）
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import clients
+import config as cf
+
+
+@pytest.fixture(autouse=True)
+def _fresh_clients(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    clients.reset()
+    yield
+    clients.reset()
+
+
+def _handler(calls):  # OpenAI 互換の最小応答（呼ばれたパスを記録）
+    def handle(request):
+        calls.append(request.url.path)
+        if request.url.path.endswith("/embeddings"):
+            body = {"object": "list", "model": "test",
+                    "data": [{"object": "embedding", "index": 0, "embedding": [1.0, 0.0]}],
+                    "usage": {"prompt_tokens": 1, "total_tokens": 1}}
+        else:
+            body = {"id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+        return httpx.Response(200, content=json.dumps(body).encode("utf-8"),
+                              headers={"content-type": "application/json"})
+    return handle
+
+
+def test_clients_use_pooled_http_clients():
+    llm, embeddings = clients.get_llm(), clients.get_embeddings()
+    http, http_async = clients.get_http_client(), clients.get_async_http_client()
+    assert llm.root_client._client is http
+    assert llm.root_async_client._client is http_async
+    assert embeddings.client._client._client is http
+    assert embeddings.async_client._client._client is http_async
+    timeout = httpx.Timeout(cf.HTTP_TIMEOUT_SEC, connect=cf.HTTP_CONNECT_TIMEOUT_SEC)
+    assert http.timeout == timeout
+    assert http_async.timeout == timeout
+
+
+def test_async_calls_go_through_pooled_client():
+    calls = []
+    clients.register("http_async", httpx.AsyncClient(transport=httpx.MockTransport(_handler(calls))))
+
+    embeddings = clients.get_embeddings()
+    embeddings.check_embedding_ctx_length = False  # tiktoken の BPE ファイル取得（ネットワーク）を避ける
+
+    async def _run():
+        answer = await clients.get_llm().ainvoke("hello")
+        vec = await embeddings.aembed_query("hello")
+        return answer.content, vec
+
+    content, vec = asyncio.run(_run())
+    assert content == "ok"
+    assert len(vec) == 2
+    assert [path.rsplit("/", 1)[-1] for path in calls] == ["completions", "embeddings"]
@@ -0,0 +1,93 @@
+"""
+test_embedding_cache.py
+埋め込みキャッシュ：ヒット/ミスの判定（同じ本文は1回だけ埋め込む・再起動後も使える）と、件数上限・保持期間での削除
+"""
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_cache as ec
+
+
+class _CountingEmbeddings(Embeddings):  # 埋め込んだ本文を記録する埋め込みクライアント
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class _Clock:  # accessed_at を決めるための時計
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock()
+    monkeypatch.setattr(ec, "time", c)  # embedding_cache の time.time() だけ差し替える
+    return c
+
+
+def _cache(tmp_path, inner, **kwargs):
+    return ec.CachedEmbeddings(inner, "test-model", str(tmp_path / "embeddings.sqlite3"), **kwargs)
+
+
+def test_hits_and_misses(tmp_path):
+    inner = _CountingEmbeddings()
+    cache = _cache(tmp_path, inner)
+
+    first = cache.embed_documents(["奨学金", "学生課", "奨学金"])
+    assert inner.texts == ["奨学金", "学生課"]  # 同じ本文は1回だけ
+    assert cache.stats()["misses"] == 3
+
+    second = cache.embed_documents(["学生課", " 奨学金\r\n"])  # 前後空白・改行コードは同じキー
+    assert inner.texts == ["奨学金", "学生課"]
+    assert second == [first[1], first[0]]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 2)
+
+    reopened = _cache(tmp_path, inner)  # 再起動後も同じ DB から読む
+    assert reopened.embed_documents(["奨学金"]) == [first[0]]
+    assert inner.texts == ["奨学金", "学生課"]
+
+
+def test_model_name_is_part_of_key(tmp_path):
+    inner = _CountingEmbeddings()
+    _cache(tmp_path, inner).embed_documents(["奨学金"])
+    ec.CachedEmbeddings(inner, "other-model", str(tmp_path / "embeddings.sqlite3")).embed_documents(["奨学金"])
+    assert inner.texts == ["奨学金", "奨学金"]
+
+
+def test_evict_keeps_most_recently_accessed(tmp_path, clock):
+    inner = _CountingEmbeddings()
+    cache = _cache(tmp_path, inner, max_entries=2)
+    for text in ("a", "b", "c"):
+        cache.embed_documents([text])
+        clock.now += 1
+    cache.embed_documents(["a"])  # 参照した "a" は新しい扱い
+    cache.evict()
+
+    assert cache.stats()["entries"] == 2
+    cache.embed_documents(["a", "b", "c"])
+    assert inner.texts == ["a", "b", "c", "b"]  # 最も古い "b" だけ消えている
+
+
+def test_evict_expired_entries(tmp_path, clock):
+    inner = _CountingEmbeddings()
+    cache = _cache(tmp_path, inner, max_age_days=1)
+    cache.embed_documents(["a"])
+    clock.now += 86400 / 2
+    cache.embed_documents(["b"])
+    clock.now += 86400 * 3 / 4  # "a" は 1.25 日、"b" は 0.75 日前
+    cache.evict()
+
+    assert cache.stats()["entries"] == 1
+    cache.embed_documents(["a", "b"])
+    assert inner.texts == ["a", "b", "a"]
@@ -0,0 +1,123 @@
+"""
+test_entity_retrieval.py
+エンティティ完全一致段の打ち切り条件（名前だけの質問のみ）と後段との統合、
+名前だけの質問で質問の埋め込みを呼ばないこと
+"""
+import logging
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+import config as cf
+import retrieval as rt
+from answer_cache import SemanticAnswerCache
+from entity_index import EntityIndex
+from rag_engine import RagEngine
+from retrieval_cache import RetrievalCache
+
+LOGGER = logging.getLogger("test_entity_retrieval")
+FACULTY = Document(page_content="学部名: 工学部\n概要: 産業を支える技術者を育てます。",
+                   metadata={"chunk_id": "f1", "bucket": "faculty", "source": "data/faculty/a.csv"})
+SCHOLARSHIP = Document(page_content="奨学金の申請は学生課で受け付けます。",
+                       metadata={"chunk_id": "s1", "bucket": "campus", "source": "data/campus/b.txt"})
+CHUNKS = [FACULTY, SCHOLARSHIP]
+
+
+class _QueryVector:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self):
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class _Store:  # 常に奨学金のチャンクを返すベクトルストア
+    def similarity_search_by_vector(self, vec, **kwargs):
+        return [SCHOLARSHIP]
+
+
+class _Retriever:
+    search_type = "similarity"
+    vectorstore = _Store()
+    search_kwargs = {"k": 2}
+
+
+def _entity_index():
+    return EntityIndex(CHUNKS, cf.ENTITY_FIELDS, fillers=cf.ENTITY_QUERY_FILLERS)
+
+
+def _retrieve(query):
+    retrieval = rt.TieredRetrieval({"all": _Retriever()}, _entity_index(), None, top_k=5)
+    query_vector = _QueryVector()
+    return retrieval.retrieve(query, query, None, query_vector, LOGGER), query_vector
+
+
+def test_is_name_only():
+    index = _entity_index()
+    assert index.is_name_only("工学部")
+    assert index.is_name_only("工学部について教えて")
+    assert index.is_name_only("工学部は？")
+    assert index.is_name_only("工学部の奨学金") is False
+    assert index.is_name_only("奨学金") is False
+
+
+def test_name_only_query_skips_vector_search():
+    result, query_vector = _retrieve("工学部について教えて")
+    assert result.tier == "entity"
+    assert [d.metadata["chunk_id"] for d in result.docs] == ["f1"]
+    assert query_vector.calls == 0
+
+
+def test_entity_hits_are_fused_with_search():
+    result, query_vector = _retrieve("工学部の奨学金")
+    assert result.tier == "strict"
+    assert [d.metadata["chunk_id"] for d in result.docs] == ["f1", "s1"]  # 名前のチャンクが先
+    assert query_vector.calls == 1
+
+
+class _Embeddings:  # 質問の埋め込み回数を数える埋め込みクライアント
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class _LLM:  # 呼び出し回数を数える LLM
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt):
+        self.calls += 1
+        return AIMessage(content="回答")
+
+
+def _engine():
+    embeddings = _Embeddings()
+    index = {
+        "version": 1,
+        "retrieval": rt.TieredRetrieval({"all": _Retriever()}, _entity_index(), None, top_k=5),
+        "embeddings": embeddings,
+        "chunks_by_id": {c.metadata["chunk_id"]: c for c in CHUNKS},
+    }
+    engine = RagEngine(index, llm=_LLM(), retrieval_cache=RetrievalCache(16, None),
+                       answer_cache=SemanticAnswerCache(16, 0.95), logger=LOGGER)
+    return engine, embeddings
+
+
+def test_name_only_answer_skips_query_embedding():
+    engine, embeddings = _engine()
+    for _ in range(2):  # 2回目は検索結果キャッシュから（段はキャッシュに残る）
+        assert engine.answer("工学部について教えて")["answer"] == "回答"
+    assert embeddings.calls == 0
+    assert engine.llm.calls == 2  # 回答キャッシュは使わない
+
+
+def test_answer_cache_still_used_after_search():
+    engine, embeddings = _engine()
+    for _ in range(2):
+        assert engine.answer("工学部の奨学金を調べたい")["answer"] == "回答"
+    assert embeddings.calls == 1
+    assert engine.llm.calls == 1  # 2回目は回答キャッシュから
@@ -0,0 +1,54 @@
+"""
+test_history_store.py
+会話履歴の JSON Lines 保存：書き込み途中で切れた最終行の扱い、行数超過時の圧縮、末尾 n 件の読み込み
+"""
+import json
+
+import history_store as hs
+
+
+def _msg(i):
+    return {"role": "user", "content": f"質問{i}"}
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_append_after_truncated_last_line(tmp_path):
+    path = str(tmp_path / "user.jsonl")
+    with open(path, "w", encoding="utf-8") as f:  # 前回の書き込み途中で落ちた状態
+        f.write(json.dumps(_msg(0), ensure_ascii=False) + "\n" + '{"role": "us')
+
+    hs.append(path, [_msg(1)], max_messages=10)
+
+    assert _lines(path)[-1] == json.dumps(_msg(1), ensure_ascii=False)  # 切れた行とつながらない
+    assert hs.read_tail(path, 10) == [_msg(0), _msg(1)]  # 切れた行は飛ばす
+
+
+def test_append_compacts_to_last_messages(tmp_path):
+    path = str(tmp_path / "user.jsonl")
+    for i in range(6):  # max_messages × compact_factor まではそのまま追記
+        hs.append(path, [_msg(i)], max_messages=3, compact_factor=2)
+    assert len(_lines(path)) == 6
+
+    hs.append(path, [_msg(6)], max_messages=3, compact_factor=2)  # 超えたら末尾 3 件に圧縮
+
+    assert hs.read_tail(path, 10) == [_msg(4), _msg(5), _msg(6)]
+    assert len(_lines(path)) == 3
+    assert not (tmp_path / "user.jsonl.tmp").exists()
+
+    hs.append(path, [_msg(7)], max_messages=3, compact_factor=2)  # 圧縮後の行数から数え直す
+    assert len(_lines(path)) == 4
+
+
+def test_read_tail_across_blocks(tmp_path):
+    path = str(tmp_path / "user.jsonl")
+    messages = [_msg(i) for i in range(50)]
+    hs.replace(path, messages)
+
+    assert hs.read_tail(path, 5, block_size=16) == messages[-5:]  # 行の途中で区切れるブロック
+    assert hs.read_tail(path, 100, block_size=16) == messages  # 件数より多く求めたら全件
+    assert hs.read_tail(path, 0) == []
+    assert hs.read_tail(str(tmp_path / "missing.jsonl"), 5) == []
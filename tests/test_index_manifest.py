@@ -0,0 +1,70 @@
+"""
+test_index_manifest.py
+取り込み台帳：ファイルの追加・編集・削除の差分判定と、取り込み設定が変わったときの作り直し
+"""
+import os
+
+import index_manifest as im
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return str(path)
+
+
+def _record(manifest, fingerprints):  # 取り込み後の台帳更新（index_builder.build_index と同じ形）
+    for path, fp in fingerprints.items():
+        manifest["sources"][path] = {**fp, "chunk_ids": []}
+
+
+def test_diff_sources_add_edit_delete(tmp_path):
+    a = _write(tmp_path / "a.txt", "奨学金の申請は学生課で受け付けます。")
+    b = _write(tmp_path / "b.txt", "機械工学科ではロボットの研究を行っています。")
+    manifest = im.empty_manifest()
+
+    changed, unchanged, removed, fps = im.diff_sources([a, b], manifest)  # 初回は全件追加
+    assert (changed, unchanged, removed) == ([a, b], [], [])
+    assert fps[a]["hash"] == im.content_hash(a)
+    _record(manifest, fps)
+
+    assert im.diff_sources([a, b], manifest)[:3] == ([], [a, b], [])  # 変更なし
+
+    _write(b, "機械工学科ではロボットと制御の研究を行っています。")  # 編集
+    c = _write(tmp_path / "c.txt", "図書館は9時から開館します。")  # 追加
+    os.remove(a)  # 削除
+    changed, unchanged, removed, fps = im.diff_sources([b, c], manifest)
+    assert (changed, unchanged, removed) == ([b, c], [], [a])
+    assert fps[b]["hash"] != manifest["sources"][b]["hash"]
+
+
+def test_diff_sources_touch_only_is_unchanged(tmp_path):
+    a = _write(tmp_path / "a.txt", "奨学金の申請は学生課で受け付けます。")
+    manifest = im.empty_manifest()
+    _record(manifest, im.diff_sources([a], manifest)[3])
+    mtime = os.stat(a).st_mtime
+    os.utime(a, (mtime + 10, mtime + 10))  # 内容は同じで mtime だけ変わる
+
+    changed, unchanged, removed, fps = im.diff_sources([a], manifest)
+    assert (changed, unchanged, removed) == ([], [a], [])
+    assert fps[a]["mtime"] == mtime + 10  # 次回は高速パスで判定できるよう更新
+
+
+def test_web_sources_are_not_removed(tmp_path):
+    manifest = im.empty_manifest()
+    manifest["sources"]["https://example.ac.jp/"] = {"web": True, "hash": "x", "chunk_ids": []}
+    assert im.diff_sources([], manifest)[2] == []
+
+
+def test_settings_change_resets_manifest(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    a = _write(tmp_path / "a.txt", "奨学金の申請は学生課で受け付けます。")
+    settings = im.settings_fingerprint({"model": "m1", "chunk_size": 500})
+    manifest = im.empty_manifest(settings)
+    _record(manifest, im.diff_sources([a], manifest)[3])
+    im.save_manifest(path, manifest)
+
+    assert im.load_manifest(path, settings)["sources"].keys() == {a}  # 同じ設定なら引き継ぐ
+    other = im.settings_fingerprint({"model": "m1", "chunk_size": 300})
+    assert other != settings
+    assert im.load_manifest(path, other)["sources"] == {}  # 設定が変わったら全件取り込み直し
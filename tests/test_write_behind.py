@@ -0,0 +1,95 @@
+"""
+test_write_behind.py
+書き込みキュー：同じキーの未実行分のまとめ（merge）、flush での完了待ち、失敗してもワーカーが止まらないこと
+"""
+import threading
+
+import pytest
+
+import history_store as hs
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def writer():
+    w = WriteBehindQueue(maxsize=8)
+    yield w
+    w.close()
+
+
+def _block(writer):  # ワーカーを止めておく（以降の投入は未実行のまま積まれる）
+    started, release = threading.Event(), threading.Event()
+
+    def task():
+        started.set()
+        release.wait(5)
+
+    writer.submit("block", task)
+    assert started.wait(5)
+    return release
+
+
+class _Batch:  # 未実行分をまとめられる処理（history_store._HistoryWrite と同じ形）
+    def __init__(self, items, runs):
+        self.items = list(items)
+        self.runs = runs
+
+    def __call__(self):
+        self.runs.append(self.items)
+
+    @staticmethod
+    def merge(old, new):
+        old.items.extend(new.items)
+        return old
+
+
+def test_pending_tasks_for_same_key_are_merged(writer):
+    runs = []
+    release = _block(writer)
+    for i in range(3):
+        writer.submit("user", _Batch([i], runs), merge=_Batch.merge)
+    writer.submit("other", _Batch(["other"], runs), merge=_Batch.merge)
+    release.set()
+    writer.flush()
+
+    assert writer.coalesced == 2
+    assert runs == [[0, 1, 2], ["other"]]  # "user" は1回にまとめて実行、キー間は投入順
+
+
+def test_merge_defaults_to_latest_task(writer):
+    calls = []
+    release = _block(writer)
+    writer.submit("user", lambda: calls.append("old"))
+    writer.submit("user", lambda: calls.append("new"))
+    release.set()
+    writer.flush()
+
+    assert calls == ["new"]
+
+
+def test_flush_waits_and_failures_do_not_stop_worker(writer):
+    calls = []
+
+    def broken():
+        raise OSError("disk full")
+
+    writer.submit("a", broken)
+    writer.submit("b", lambda: calls.append("b"))
+    writer.flush()
+
+    assert writer.failed == 1
+    assert calls == ["b"]
+
+
+def test_history_appends_are_coalesced(tmp_path, writer, monkeypatch):
+    monkeypatch.setattr(hs, "WRITER", writer)
+    path = str(tmp_path / "user.jsonl")
+    release = _block(writer)
+    hs.submit_replace(path, [{"role": "user", "content": "q0"}])
+    hs.submit_append(path, [{"role": "assistant", "content": "a0"}], max_messages=10)
+    hs.submit_append(path, [{"role": "user", "content": "q1"}], max_messages=10)
+    release.set()
+    hs.flush()
+
+    assert writer.coalesced == 2  # 置き換え + 追記 + 追記 → 1回の置き換え
+    assert [m["content"] for m in hs.read_tail(path, 10)] == ["q0", "a0", "q1"]
@@ -0,0 +1,154 @@
+"""
+tracing.py
+質問1件ごとの処理時間の計測（段階ごとの span）と、JSON 1行のトレース出力・集計
+
+    with tracing.trace(mode="research"):        # 質問1件分（終了時に JSON を1行出力）
+        with tracing.span("retrieval"):          # 段階の所要時間
+            ...
+        tracing.annotate(context_tokens=1200)    # トークン数・キャッシュヒットなど
+
+トレース中でなければ span / annotate は何もしない
+集計:
+    python tracing.py logs/trace.jsonl*
+"""
+import contextlib
+import contextvars
+import glob
+import json
+import logging
+import math
+import sys
+import threading
+import time
+import uuid
+
+import config as cf
+from log_context import SESSION_ID
+
+_CURRENT = contextvars.ContextVar("trace", default=None)  # 実行中のトレース
+
+
+class Trace:
+    """質問1件分の計測値（段階ごとの所要時間 ms と付加情報）"""
+
+    def __init__(self, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]  # トレースID
+        self.started = time.time()  # 開始時刻（UNIX 秒）
+        self._t0 = time.perf_counter()
+        self.stages = {}  # 段階名 → 所要時間（ms。同じ段階は合算）
+        self.attrs = dict(attrs)  # 付加情報
+        self._lock = threading.Lock()  # 別スレッド（ベクトル検索など）からの記録用
+
+    def add_stage(self, name: str, ms: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def annotate(self, **attrs):
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def to_record(self) -> dict:  # 出力する JSON
+        with self._lock:
+            return {
+                "ts": round(self.started, 3),
+                "trace_id": self.trace_id,
+                "session_id": SESSION_ID.get(),
+                "total_ms": round((time.perf_counter() - self._t0) * 1000, 2),
+                "stages": {k: round(v, 2) for k, v in self.stages.items()},
+                **self.attrs,
+            }
+
+
+def current() -> Trace | None:  # 実行中のトレース
+    return _CURRENT.get()
+
+
+@contextlib.contextmanager
+def trace(**attrs):  # 質問1件分のトレース
+    """終了時（例外時も）に1行の JSON を trace ロガーへ出力する"""
+    if not cf.TRACE_ENABLED:
+        yield None
+        return
+    t = Trace(**attrs)
+    token = _CURRENT.set(t)
+    try:
+        yield t
+    except Exception as e:
+        t.annotate(error=type(e).__name__)
+        raise
+    finally:
+        _CURRENT.reset(token)
+        logging.getLogger(cf.TRACE_LOGGER_NAME).info(
+            "%s", json.dumps(t.to_record(), ensure_ascii=False))
+
+
+@contextlib.contextmanager
+def span(name: str):  # 段階の所要時間（トレース中のみ記録）
+    t = _CURRENT.get()
+    if t is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t.add_stage(name, (time.perf_counter() - t0) * 1000)
+
+
+def record(name: str, ms: float):  # 計測済みの時間を段階として記録（トレース中のみ）
+    t = _CURRENT.get()
+    if t is not None:
+        t.add_stage(name, ms)
+
+
+def annotate(**attrs):  # 付加情報（トレース中のみ記録）
+    t = _CURRENT.get()
+    if t is not None:
+        t.annotate(**attrs)
+
+
+# ===== 集計 =====
+
+
+def _percentile(sorted_values, q):  # 最近傍順位のパーセンタイル
+    idx = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+def summarize(paths) -> dict:  # トレースログ → 段階ごとの件数・p50/p95/p99（ms）
+    samples = {"total": []}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:  # 壊れた行・トレース以外の行
+                    continue
+                samples["total"].append(rec.get("total_ms", 0.0))
+                for name, ms in (rec.get("stages") or {}).items():
+                    samples.setdefault(name, []).append(ms)
+    summary = {}
+    for name, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "p99": _percentile(values, 0.99),
+        }
+    return summary
+
+
+def main(argv=None):
+    patterns = (argv if argv is not None else sys.argv[1:]) or [f"{cf.LOG_DIR}/{cf.TRACE_LOG_FILE}*"]
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    summary = summarize(paths)
+    print(f"{'stage':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, s in sorted(summary.items(), key=lambda kv: (kv[0] != "total", kv[0])):
+        print(f"{name:<28} {s['count']:>6} {s['p50']:>9.2f} {s['p95']:>9.2f} {s['p99']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
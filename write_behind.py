@@ -0,0 +1,114 @@
+"""
+write_behind.py
+ファイル書き込みをバックグラウンドで行うプロセス共有のワーカー（履歴保存・ログ出力）
+画面描画のスレッドではキューに積むだけにし、ディスク I/O を待たない
+"""
+import atexit
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+import config as cf
+
+
+class WriteBehindQueue:
+    """
+    キー単位でまとめる書き込みキュー（上限付き）
+    - 同じキーの処理が未実行のまま積まれたら merge で1つにまとめる（同じユーザーの連続保存など）
+    - 処理は1本のワーカースレッドで投入順に実行する
+    - キューが満杯のときは空きが出るまで投入側が待つ
+    """
+
+    def __init__(self, maxsize: int, logger_name: str | None = None):
+        self._queue = queue.Queue(maxsize=maxsize)  # 実行待ちのキー
+        self._pending = {}  # キー → 実行待ちの処理
+        self._lock = threading.Lock()  # _pending の保護
+        self._logger_name = logger_name  # 失敗時のログ出力先
+        self._thread = None  # ワーカースレッド（初回投入時に起動）
+        self.coalesced = 0  # まとめられた件数
+        self.failed = 0  # 失敗件数
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="write-behind", daemon=True)
+                    self._thread.start()
+
+    def submit(self, key, task, merge=None):  # 処理の投入
+        """
+        task: 引数なしの呼び出し可能オブジェクト
+        merge: (未実行の task, 新しい task) → まとめた task。省略時は新しい task で置き換える
+        """
+        self._ensure_worker()
+        with self._lock:
+            if key in self._pending:  # 未実行の同じキーがあればまとめる
+                old = self._pending[key]
+                self._pending[key] = merge(old, task) if merge else task
+                self.coalesced += 1
+                return
+            self._pending[key] = task
+        self._queue.put(key)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                if key is None:  # 停止指示
+                    return
+                with self._lock:
+                    task = self._pending.pop(key, None)
+                if task is not None:
+                    task()
+            except Exception:  # 1件の失敗でワーカーを止めない
+                self.failed += 1
+                if self._logger_name:
+                    logging.getLogger(self._logger_name).exception("Write-behind task failed")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):  # 投入済みの処理がすべて終わるまで待つ
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):  # 残りを実行してからワーカーを止める
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+
+WRITER = WriteBehindQueue(  # プロセス共有インスタンス
+    maxsize=cf.WRITE_BEHIND_QUEUE_SIZE, logger_name=cf.APP_LOGGER_NAME)
+
+_LOG_LOCK = threading.Lock()
+_LOG_LISTENERS = []  # ログ出力用リスナー（実際のハンドラを別スレッドで呼ぶ）
+
+
+def queue_logging(handlers) -> QueueHandler:  # ログ出力のキュー化
+    """
+    handlers（ファイル・コンソール）を QueueListener の別スレッドで動かし、
+    ロガーに付ける QueueHandler を返す（リスナーは終了時に止める）
+    """
+    log_queue = queue.SimpleQueue()  # ログは落とさない・待たせない（上限なし）
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    with _LOG_LOCK:
+        _LOG_LISTENERS.append(listener)
+        listener.start()
+    return QueueHandler(log_queue)
+
+
+def shutdown():  # 終了時：履歴の書き込みとログの出力を済ませる
+    WRITER.close()
+    with _LOG_LOCK:
+        listeners = list(_LOG_LISTENERS)
+        _LOG_LISTENERS.clear()
+    for listener in listeners:  # 残りを出力してからハンドラを閉じる
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown)